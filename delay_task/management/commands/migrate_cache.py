@@ -0,0 +1,12 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from delay_task.views import migrate_legacy_keys
+
+
+class Command(BaseCommand):
+    help = 'Move the entries cached by previous version to the current keys, run it once after upgrade'
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(migrate_legacy_keys(), indent=2))
@@ -0,0 +1,58 @@
+import json
+import logging
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delay_task.views import start_delay_task, start_vote_flush_task, drain, stop_event, refresh_interval
+from meeting_sample.settings import SCHEDULER_CONCURRENCY
+from utils import cache
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run the delay task and vote flush task out of the web process, stop gracefully on SIGTERM or SIGINT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=SCHEDULER_CONCURRENCY,
+                            help='Scheduled tasks processed at the same time')
+        parser.add_argument('--drain-timeout', type=float, default=60,
+                            help='Seconds to wait for the tasks in hand when stopping')
+        parser.add_argument('--check', action='store_true',
+                            help='Print health of running workers, exit with error if none is alive')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_health()
+            return
+
+        if options['concurrency'] < 1:
+            raise CommandError('concurrency must be positive')
+
+        def on_signal(signum, frame):
+            logger.info(f'received signal {signum}, draining')
+            # a second signal kills the worker at once
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, on_signal)
+        signal.signal(signal.SIGINT, on_signal)
+
+        start_delay_task(options['concurrency'])
+        start_vote_flush_task()
+        self.stdout.write(f'scheduler started, concurrency: {options["concurrency"]}')
+
+        stop_event.wait()
+        if drain(options['drain_timeout']):
+            self.stdout.write('scheduler stopped')
+        else:
+            logger.warning(f'tasks are not finished in {options["drain_timeout"]}s, they will be claimed again')
+            self.stdout.write('scheduler stopped before tasks finished')
+
+    def check_health(self):
+        workers = cache.delay_queue.workers_health(3 * refresh_interval)
+        self.stdout.write(json.dumps({'workers': workers, **cache.delay_queue.stats()}, indent=2))
+        if not workers:
+            raise CommandError('no scheduler worker is alive')
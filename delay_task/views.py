@@ -1,40 +1,287 @@
+import datetime
 import logging
+import os
+import socket
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
 
 from django.db import close_old_connections
 
+from meeting.models import Meeting
 from meeting.views import StopMeetingAPI
+from meeting_sample.settings import POLL_WRITE_BEHIND, SCHEDULER_CONCURRENCY
+from poll.models import Poll
+from poll.views import PollCommitAPI, PollStopAPI
 from utils import cache
+from utils.cache.delay_queue import Task, MEETING_CLOSE, GROUP_CLOSE, POLL_STOP, SHARE_EXPIRE
 
 thread_id = 0
-refresh_interval = 20  # 20 seconds
+refresh_interval = 20  # seconds, at most to wait for the next due task
+claim_batch = 100
+visibility_timeout = 120  # seconds to process a task before other workers claim it again
+max_attempts = 10
+retry_backoff = 5  # seconds, doubled for each attempt
+flush_thread_id = 0
+flush_interval = 0.2  # 200 milliseconds
+flush_visibility_timeout = 60  # seconds to persist a batch of ballots before other workers claim it again
 logger = logging.getLogger(__name__)
 
+# schedule lag: seconds from due time of a task to it's claimed
+metrics = {'claimed': 0, 'processed': 0, 'failed': 0, 'last_lag': 0.0, 'max_lag': 0.0, 'total_lag': 0.0}
+
+# set to stop the tasks, they finish the batch in hand before stopping
+stop_event = threading.Event()
+# held while a batch is in hand, so that draining waits for it
+_processing = threading.Lock()
+_flushing = threading.Lock()
+worker_name = f'{socket.gethostname()}:{os.getpid()}'
+
 
 # Create your views here.
-def start_delay_task():
+def start_delay_task(concurrency: int = SCHEDULER_CONCURRENCY) -> Optional[threading.Thread]:
     if thread_id != 0:
         logger.warning(f'delay task is already running, TID: {thread_id}')
-        return
+        return None
+
+    t = threading.Thread(target=__delay_task, args=(concurrency,), name='Delay Task', daemon=True)
+    t.start()
+    logger.info(f'start delay task, concurrency: {concurrency}')
+    return t
 
-    threading.Thread(target=__delay_task, name='Delay Task', daemon=True).start()
-    logger.info(f'start delay task')
 
+def drain(timeout: float) -> bool:
+    """
+    Stop the tasks, and wait for the batches in hand to finish at most timeout seconds.
+    Return False if timeout, the unfinished tasks are claimed again after the visibility timeout.
+    """
+    stop_event.set()
+    end = time.time() + timeout
+    for lock in (_processing, _flushing):
+        if not lock.acquire(timeout=max(end - time.time(), 0)):
+            return False
+    return True
 
-def __delay_task():
+
+def __delay_task(concurrency: int):
     global thread_id
     thread_id = threading.get_ident()
     logger.info(f'delay task started')
 
-    while True:
+    try:
+        __recover_closing_meetings()
+    except Exception as e:
+        logger.warning(f'failed to recover closing meetings: {e}')
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='Task Worker')
+    reported_at = 0
+    while not stop_event.is_set():
+        timeout = refresh_interval
         try:
-            for meeting in cache.delay_queue.retrieve():
-                close_old_connections()
-                logger.info(f'to close meeting: {meeting}')
-                StopMeetingAPI.stop_meeting(meeting, None)
+            with _processing:
+                if stop_event.is_set():
+                    break
+                claimed = cache.delay_queue.claim(claim_batch, visibility_timeout)
+                if claimed:
+                    __record_lag(claimed)
+                    close_old_connections()
+                    logger.info(f'to process tasks: {[x.member for x in claimed]}')
+                    __process_tasks(claimed, executor)
+
+            if time.time() - reported_at >= refresh_interval:
+                __report_health(concurrency)
+                reported_at = time.time()
+            if len(claimed) == claim_batch:
+                continue
+
+            # sleep until the next due task, a task scheduled ahead of it wakes up the worker
+            due = cache.delay_queue.next_due()
+            if due is not None:
+                timeout = min(due, refresh_interval)
+            logger.debug(f'wait {timeout:.3f}s for next due task')
+            cache.delay_queue.wait(timeout)
+        except Exception as e:
+            logger.warning(f'ignore exception: {e}')
+            stop_event.wait(timeout)
+
+    executor.shutdown(wait=True)
+    logger.info(f'delay task stopped')
+
+
+def __report_health(concurrency: int):
+    claimed = metrics['claimed']
+    health = {
+        'worker': worker_name,
+        'concurrency': concurrency,
+        'reported_at': datetime.datetime.utcnow().timestamp(),
+        'claimed': claimed,
+        'processed': metrics['processed'],
+        'failed': metrics['failed'],
+        'last_lag': metrics['last_lag'],
+        'max_lag': metrics['max_lag'],
+        'avg_lag': metrics['total_lag'] / claimed if claimed else 0.0,
+        **cache.delay_queue.stats(),
+    }
+    # reported at least once each refresh interval, the worker is gone if it misses three reports
+    cache.delay_queue.report_health(worker_name, health, 3 * refresh_interval)
+    logger.debug(f'health of delay task: {health}')
+
+
+def __record_lag(claimed: List[Task]):
+    # due time is scored in the same way as utils.cache.delay_queue
+    now = datetime.datetime.utcnow().timestamp()
+    lags = [max(now - x.due, 0) for x in claimed]
+    metrics['claimed'] += len(lags)
+    metrics['last_lag'] = max(lags)
+    metrics['max_lag'] = max(metrics['max_lag'], max(lags))
+    metrics['total_lag'] += sum(lags)
+    logger.info(f'schedule lag of {len(lags)} tasks: max {max(lags):.3f}s, avg {sum(lags) / len(lags):.3f}s')
+
+
+def __process_tasks(tasks: List[Task], executor: ThreadPoolExecutor):
+    """
+    Dispatch the tasks to handlers in batch of kind, ack the processed ones and retry others
+    """
+    start = time.time()
+    batches = defaultdict(list)
+    for task in tasks:
+        batches[task.kind].append(task)
+
+    failed = 0
+    for kind, batch in batches.items():
+        handler = handlers.get(kind)
+        if handler is None:
+            logger.error(f'unknown kind of tasks: {[x.member for x in batch]}, drop them')
+            for task in batch:
+                cache.delay_queue.ack(task.member)
+            continue
+
+        try:
+            result = handler(batch, executor)
+        except Exception as e:
+            logger.warning(f'failed to process {kind} tasks: {[x.key for x in batch]}: {e}')
+            result = {}
+
+        for task in batch:
+            if result.get(task.member, False):
+                cache.delay_queue.ack(task.member)
+                continue
+            failed += 1
+            if cache.delay_queue.retry(task.member, max_attempts, retry_backoff):
+                logger.warning(f'failed to process task: {task.member}, retry later')
             else:
-                logger.debug('empty delay queue')
+                logger.error(f'failed to process task: {task.member} after {max_attempts} attempts, '
+                             f'move to dead letters')
+    metrics['processed'] += len(tasks) - failed
+    metrics['failed'] += failed
+    logger.info(f'processed {len(tasks) - failed} tasks, failed {failed}, cost: {time.time() - start:.3f}s')
+
+
+def __close_meetings(tasks: List[Task], executor: ThreadPoolExecutor) -> Dict[str, bool]:
+    result = StopMeetingAPI.stop_meetings([int(x.key) for x in tasks], executor)
+    return {x.member: result.get(int(x.key), False) for x in tasks}
+
+
+def __close_groups(tasks: List[Task], executor: ThreadPoolExecutor) -> Dict[str, bool]:
+    for task in tasks:
+        cache.group.close_group(int(task.key))
+        logger.info(f'close group of meeting: {task.key}')
+    return {x.member: True for x in tasks}
+
+
+def __stop_polls(tasks: List[Task], executor: ThreadPoolExecutor) -> Dict[str, bool]:
+    result = {}
+    polls = Poll.objects.in_bulk([int(x.key) for x in tasks])
+    for task in tasks:
+        poll = polls.get(int(task.key))
+        # the poll is stopped by host, or restarted as another round
+        if poll is None or poll.status != Poll.Status.ONGOING.value or poll.round != task.payload['round']:
+            result[task.member] = True
+            continue
+        result[task.member] = PollStopAPI.stop_poll(poll)
+        logger.info(f'stop poll: {poll.id} round: {poll.round}, result: {result[task.member]}')
+    return result
+
+
+def __expire_shares(tasks: List[Task], executor: ThreadPoolExecutor) -> Dict[str, bool]:
+    for task in tasks:
+        # the lease is renewed or taken by others if the holder changed
+        if cache.get_sharing_user(int(task.key)) != task.payload['user']:
+            cache.wake_share(int(task.key))
+            logger.info(f'share lease of meeting {task.key} expired, wake up waiting users')
+    return {x.member: True for x in tasks}
+
+
+handlers: Dict[str, Callable[[List[Task], ThreadPoolExecutor], Dict[str, bool]]] = {
+    MEETING_CLOSE: __close_meetings,
+    GROUP_CLOSE: __close_groups,
+    POLL_STOP: __stop_polls,
+    SHARE_EXPIRE: __expire_shares,
+}
+
+
+def migrate_legacy_keys() -> Dict[str, int]:
+    """
+    Move the entries cached by previous version to the current keys, it's run by the command migrate_cache
+    after processes of previous version are stopped. It's safe to run again.
+    """
+    result = {
+        'tasks': cache.delay_queue.migrate_legacy_tasks(__share_users),
+        'share_users': cache.share_user.migrate_legacy_ids(),
+        'meetings': cache.migrate_legacy_meetings(),
+    }
+    logger.info(f'migrated keys of previous version: {result}')
+    return result
+
+
+def __share_users(meetings: List[int]) -> Dict[int, Optional[int]]:
+    close_old_connections()
+    return dict(Meeting.objects.filter(call_number__in=meetings).values_list('call_number', 'share_user_id'))
+
+
+def __recover_closing_meetings():
+    """
+    Push the meetings accepted to stop again, in case they are lost from the delay queue
+    """
+    close_old_connections()
+    now = int(datetime.datetime.utcnow().timestamp())
+    closing = Meeting.objects.filter(status=Meeting.RoomStatus.CLOSING).values_list('call_number', 'share_user_id')
+    for meeting, share_user_id in closing:
+        cache.delay_queue.push(meeting, now, share_user_id)
+        logger.info(f'recover closing meeting: {meeting}')
+
+
+def start_vote_flush_task() -> Optional[threading.Thread]:
+    if not POLL_WRITE_BEHIND:
+        logger.info('poll write-behind is disabled, not start vote flush task')
+        return None
+
+    if flush_thread_id != 0:
+        logger.warning(f'vote flush task is already running, TID: {flush_thread_id}')
+        return None
+
+    t = threading.Thread(target=__vote_flush_task, name='Vote Flush Task', daemon=True)
+    t.start()
+    logger.info(f'start vote flush task')
+    return t
+
+
+def __vote_flush_task():
+    global flush_thread_id
+    flush_thread_id = threading.get_ident()
+    logger.info(f'vote flush task started')
+
+    while not stop_event.is_set():
+        try:
+            with _flushing:
+                if stop_event.is_set():
+                    break
+                close_old_connections()
+                if PollCommitAPI.flush_batch(flush_visibility_timeout):
+                    continue
         except Exception as e:
             logger.warning(f'ignore exception: {e}')
-        time.sleep(refresh_interval)
+        stop_event.wait(flush_interval)
+    logger.info(f'vote flush task stopped')
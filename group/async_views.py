@@ -0,0 +1,38 @@
+"""
+Async variants of the hot group APIs, routed instead of the APIViews when ASYNC_VIEWS is enabled
+"""
+import logging
+
+from rest_framework import exceptions
+
+from group.serializers import GroupDetailIn, GroupDetailOut
+from utils.async_view import async_api
+from utils.cache import aio
+from utils.errors import ERROR
+from utils.resp import r200
+
+logger = logging.getLogger(__name__)
+
+
+@async_api()
+async def group_detail(request):
+    logger.info(f'[group_detail] user:{request.user.id} get group detail: {request.data}')
+
+    data_in = GroupDetailIn(data=request.data)
+    if not data_in.is_valid():
+        logger.error(f'invalid parameter: {data_in.errors}')
+        err = ERROR['INPUT']
+        err['data'] = data_in.errors
+        raise exceptions.ValidationError(err)
+    number = data_in.validated_data['number']
+    try:
+        group_info = await aio.get_group_info(number)
+    except Exception as e:
+        logger.error(f'failed to get group info: {e}')
+        err = ERROR['INTERNAL']
+        err['data'] = 'failed to get group info'
+        raise exceptions.APIException(err)
+
+    out = GroupDetailOut(instance={'group': group_info})
+    logger.info(f'[group_detail] success: {out.data}')
+    return r200(out.data)
@@ -25,6 +25,7 @@ class GroupInfo(serializers.Serializer):
 
 class StartIn(GroupDetailIn):
     group = serializers.ListField(help_text='group information', child=GroupInfo())
+    duration = serializers.IntegerField(required=False, min_value=1, help_text='Seconds to close the group automatically')
 
 
 class BaseOut(serializers.Serializer):
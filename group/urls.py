@@ -1,6 +1,7 @@
 from django.urls import path
 
 from group.views import *
+from meeting_sample.settings import ASYNC_VIEWS
 
 urlpatterns = [
     path('start/', GroupStartAPI.as_view()),
@@ -8,3 +9,11 @@ urlpatterns = [
     path('move_member/', MoveMemberAPI.as_view()),
     path('detail/', GroupDetailAPI.as_view()),
 ]
+
+if ASYNC_VIEWS:
+    # served on the event loop under ASGI, they are matched before the APIViews of the same paths
+    from group.async_views import group_detail
+
+    urlpatterns = [
+        path('detail/', group_detail),
+    ] + urlpatterns
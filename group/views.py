@@ -10,6 +10,7 @@ from rest_framework_jwt.authentication import JSONWebTokenAuthentication
 
 from group.serializers import StartIn, BaseOut, MoveMemberIn, GroupDetailIn, GroupDetailOut
 from meeting.models import Meeting
+from meeting.views import MeetingInfoAPI
 from utils import cache
 from utils.errors import ERROR
 from utils.resp import r200
@@ -38,7 +39,7 @@ class GroupStartAPI(APIView):
         group_info = data_in.validated_data['group']
 
         try:
-            meeting = Meeting.objects.get(call_number=number)
+            meeting = MeetingInfoAPI.get_meeting(number)
         except ObjectDoesNotExist:
             logger.error(f'invalid meeting: {number}')
             err = ERROR['MEETING_NOT_FOUND']
@@ -64,6 +65,9 @@ class GroupStartAPI(APIView):
             err['data'] = f'group already start for meeting: {number}'
             raise exceptions.ValidationError(err)
 
+        if 'duration' in data_in.validated_data:
+            cache.delay_queue.schedule_after(cache.delay_queue.GROUP_CLOSE, number, data_in.validated_data['duration'])
+
         out = BaseOut(instance={'success': True})
         logger.info(f'[GroupStartAPI] success: {out.data}')
         return r200(out.data)
@@ -89,7 +93,7 @@ class GroupStopAPI(APIView):
         number = data_in.validated_data['number']
 
         try:
-            meeting = Meeting.objects.get(call_number=number)
+            meeting = MeetingInfoAPI.get_meeting(number)
         except ObjectDoesNotExist:
             logger.error(f'invalid meeting: {number}')
             err = ERROR['MEETING_NOT_FOUND']
@@ -109,6 +113,7 @@ class GroupStopAPI(APIView):
             raise exceptions.PermissionDenied(err)
 
         cache.group.close_group(number)
+        cache.delay_queue.cancel(cache.delay_queue.GROUP_CLOSE, number)
 
         out = BaseOut(instance={'success': True})
         logger.info(f'[GroupStopAPI] success: {out.data}')
@@ -139,7 +144,8 @@ class MoveMemberAPI(APIView):
         to_group = data_in.validated_data['to_group']
 
         try:
-            Meeting.objects.get(call_number=number, status=Meeting.RoomStatus.ONGOING)
+            if MeetingInfoAPI.get_meeting(number).status != Meeting.RoomStatus.ONGOING:
+                raise Meeting.DoesNotExist
         except ObjectDoesNotExist:
             logger.error(f'invalid meeting ID or status {number}')
             err = ERROR['MEETING_NOT_FOUND']
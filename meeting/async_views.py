@@ -0,0 +1,122 @@
+"""
+Async variants of the hot meeting APIs, routed instead of the APIViews when ASYNC_VIEWS is enabled
+"""
+import logging
+import time
+
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework.exceptions import ValidationError, PermissionDenied
+
+from meeting.models import Meeting
+from meeting.serializers import BaseMeetingOut, JoinMeetingOut, MeetingIn, StartShareIn, ShareOut
+from meeting.views import MeetingInfoAPI, JoinMeetingAPI, StartShareAPI
+from meeting_sample.settings import SHARE_LEASE_TIME
+from utils.async_view import async_api, db_sync_to_async
+from utils.cache import aio
+from utils.cache.delay_queue import SHARE_EXPIRE
+from utils.errors import ERROR
+from utils.resp import r200
+
+logger = logging.getLogger(__name__)
+
+
+async def get_meeting(number: int) -> Meeting:
+    """
+    Get a meeting from the cached snapshot on the event loop, a miss is loaded by MeetingInfoAPI in a thread
+    """
+    try:
+        _, cached, snapshot = await aio.get_meeting_snapshot(number)
+    except Exception as e:
+        logger.warning(f'failed to get meeting {number} from cache: {e}')
+        cached, snapshot = False, None
+
+    if not cached:
+        return await db_sync_to_async(MeetingInfoAPI.get_meeting)(number)
+    if snapshot is None:
+        raise Meeting.DoesNotExist(f'meeting not found: {number}')
+    return MeetingInfoAPI.from_snapshot(snapshot)
+
+
+@async_api()
+async def join_meeting(request):
+    logger.info(f'[join_meeting] user: {request.user.id} join meeting: {request.data}')
+
+    data = JoinMeetingAPI.validate(request.data)
+    number = data['number']
+
+    try:
+        meeting = await get_meeting(number)
+    except ObjectDoesNotExist:
+        raise JoinMeetingAPI.not_found(number)
+
+    JoinMeetingAPI.check_join(meeting, data)
+
+    if meeting.status == Meeting.RoomStatus.NEW:
+        await db_sync_to_async(JoinMeetingAPI.start)(meeting)
+
+    try:
+        _, group_info = await aio.lookup_meeting(meeting.call_number)
+    except Exception as e:
+        raise JoinMeetingAPI.group_info_failed(e)
+
+    out = JoinMeetingOut(instance=JoinMeetingAPI.join_info(meeting, request.user.id, group_info))
+    logger.info(f'[join_meeting] success: {out.data}')
+    return r200(out.data)
+
+
+@async_api()
+async def start_share(request):
+    logger.info(f'[start_share] user: {request.user.id} request to start share: {request.data}')
+
+    data_in = StartShareIn(data=request.data)
+    if not data_in.is_valid():
+        logger.error(data_in.errors)
+        err = ERROR['MEETING_INPUT']
+        err['data'] = data_in.errors
+        raise ValidationError(err)
+    number = data_in.validated_data['number']
+    wait = data_in.validated_data['wait']
+
+    # the waiting request holds a Redis connection of the waiter pool but no thread
+    deadline = time.time() + wait
+    while True:
+        share_user, ttl = await aio.acquire_share(number, request.user.id, SHARE_LEASE_TIME * 1000)
+        timeout = StartShareAPI.wait_time(deadline, share_user, ttl)
+        if timeout is None:
+            break
+        if timeout > 0:
+            await aio.wait_share(number, timeout)
+
+    StartShareAPI.check_acquired(number, share_user)
+
+    await aio.schedule_after(SHARE_EXPIRE, number, SHARE_LEASE_TIME + 1, {'user': request.user.id})
+
+    out = ShareOut(instance=dict(success=True, lease=SHARE_LEASE_TIME))
+    logger.info(f'[start_share] success: meeting: {number}, user: {request.user.id}')
+    return r200(out.data)
+
+
+@async_api()
+async def stop_share(request):
+    logger.info(f'[stop_share] user: {request.user.id} request to stop share: {request.data}')
+
+    data_in = MeetingIn(data=request.data)
+    if not data_in.is_valid():
+        logger.error(data_in.errors)
+        err = ERROR['MEETING_INPUT']
+        err['data'] = data_in.errors
+        raise ValidationError(err)
+    number = data_in.validated_data['number']
+
+    if not await aio.release_share(number, request.user.id):
+        share_user = await aio.get_sharing_user(number)
+        logger.error(f'share user not match request user')
+        err = ERROR['NOT_SHARE']
+        err['data'] = f'sharing user is {share_user}'
+        raise PermissionDenied(err)
+
+    await aio.cancel(SHARE_EXPIRE, number)
+
+    out = BaseMeetingOut(instance=dict(success=True))
+    logger.info(f'[stop_share] success: {out.data}')
+    return r200(out.data)
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Meeting',
+            fields=[
+                ('deleted', models.DateTimeField(editable=False, null=True)),
+                ('name', models.CharField(max_length=128)),
+                ('status', models.IntegerField(choices=[(0, 'New'), (1, 'Ongoing'), (2, 'Closed')], default=0)),
+                ('call_number', models.IntegerField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField()),
+                ('begin_at', models.DateTimeField()),
+                ('end_at', models.DateTimeField()),
+                ('mute_type', models.IntegerField(choices=[(0, 'Unmute'), (1, 'All Mute'), (2, 'Auto')], default=0)),
+                ('actually_begin_at', models.DateTimeField(blank=True, null=True)),
+                ('actually_end_at', models.DateTimeField(blank=True, null=True)),
+                ('password', models.CharField(blank=True, max_length=512, null=True)),
+                ('share_user_id', models.IntegerField(null=True)),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='close_user', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='owner_user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'meeting',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meeting', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='call_sequence',
+            field=models.IntegerField(editable=False, null=True, unique=True),
+        ),
+    ]
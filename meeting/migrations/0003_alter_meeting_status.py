@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meeting', '0002_meeting_call_sequence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='meeting',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'New'), (1, 'Ongoing'), (2, 'Closed'), (3, 'Closing')], default=0),
+        ),
+    ]
@@ -14,6 +14,7 @@ class Meeting(SafeDeleteModel):
         NEW = 0
         ONGOING = 1
         CLOSED = 2
+        CLOSING = 3  # accepted to stop, waiting for the delay task to close LVB room
 
     class MuteType(models.IntegerChoices):
         UNMUTE = 0
@@ -24,6 +25,8 @@ class Meeting(SafeDeleteModel):
     status = models.IntegerField(choices=RoomStatus.choices, default=RoomStatus.NEW)
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='owner_user')
     call_number = models.IntegerField(primary_key=True)
+    # sequence encoded to call number, null for the meetings created before
+    call_sequence = models.IntegerField(null=True, unique=True, editable=False)
     created = models.DateTimeField()
 
     begin_at = models.DateTimeField()
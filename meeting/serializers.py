@@ -34,6 +34,11 @@ class BaseMeetingOut(BaseSerializer):
     success = serializers.BooleanField()
 
 
+class StopMeetingOut(BaseMeetingOut):
+    status = serializers.ChoiceField(choices=Meeting.RoomStatus.choices,
+                                     help_text='CLOSING until the meeting is closed in background, query it by info')
+
+
 class MeetingInfoIn(BaseSerializer):
     number = serializers.IntegerField(help_text='Call number of meeting')
 
@@ -79,6 +84,15 @@ class MeetingIn(BaseSerializer):
     number = serializers.IntegerField()
 
 
+class StartShareIn(MeetingIn):
+    wait = serializers.IntegerField(default=0, min_value=0, max_value=30,
+                                    help_text='Seconds to wait if other is sharing')
+
+
+class ShareOut(BaseMeetingOut):
+    lease = serializers.IntegerField(help_text='Seconds of share lease, renew it by heartbeat before expired')
+
+
 class JoinMeetingOut(BaseSerializer):
     token = serializers.CharField()
     app_key = serializers.CharField()
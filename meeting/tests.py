@@ -1,3 +1,194 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+import unittest
+import uuid
+from http.server import ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from redis import RedisError
+
+from utils import lvb
+from utils.cache import delay_queue
+from utils.cache.connection import client
+from utils.cache.share_user import SHARE_USER_KEY
+from utils.call_number import CALL_NUMBER_MIN, CALL_NUMBER_SPACE, CallNumberCipher
+from utils.lvb_stub import LVBStubHandler
+
+
+class StopLVBRoomAsyncTest(SimpleTestCase):
+    """
+    The async variant against the local LVB stub
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        handler = type('Handler', (LVBStubHandler,), {'latency': 0.2})
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.host = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        patcher = mock.patch.object(lvb, 'LVB_HOST', self.host)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        lvb.breaker.on_success()
+
+    def test_stop_room(self):
+        success, room_id = asyncio.run(lvb.stop_lvb_room_async('token'))
+        self.assertTrue(success)
+        self.assertGreater(room_id, 0)
+
+    def test_not_block_event_loop(self):
+        async def stop_rooms():
+            return await asyncio.gather(*[lvb.stop_lvb_room_async('token') for _ in range(4)])
+
+        start = time.time()
+        results = asyncio.run(stop_rooms())
+        # each call waits 2 responses of 0.2 seconds, they run in threads at the same time
+        self.assertLess(time.time() - start, 4 * 0.4)
+        self.assertEqual(len({room_id for _, room_id in results}), 4)
+        self.assertTrue(all(success for success, _ in results))
+
+
+class CallNumberCipherTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cipher = CallNumberCipher('test')
+        # the first sequences, and the last ones where cycle-walking is most likely
+        cls.sequences = list(range(20000)) + list(range(CALL_NUMBER_SPACE - 1000, CALL_NUMBER_SPACE))
+        cls.numbers = [cls.cipher.encode(x) for x in cls.sequences]
+
+    def test_range(self):
+        for number in self.numbers:
+            self.assertTrue(CALL_NUMBER_MIN <= number < CALL_NUMBER_MIN + CALL_NUMBER_SPACE, number)
+
+    def test_unique(self):
+        self.assertEqual(len(set(self.numbers)), len(self.numbers))
+
+    def test_round_trip(self):
+        for sequence, number in zip(self.sequences, self.numbers):
+            self.assertEqual(self.cipher.decode(number), sequence)
+
+    def test_key(self):
+        other = CallNumberCipher('other')
+        self.assertNotEqual([other.encode(x) for x in range(100)], self.numbers[:100])
+
+    def test_out_of_range(self):
+        for sequence in (-1, CALL_NUMBER_SPACE):
+            with self.assertRaises(ValueError):
+                self.cipher.encode(sequence)
+        for number in (CALL_NUMBER_MIN - 1, CALL_NUMBER_MIN + CALL_NUMBER_SPACE):
+            with self.assertRaises(ValueError):
+                self.cipher.decode(number)
+
+
+def redis_available() -> bool:
+    try:
+        return client.ping()
+    except RedisError:
+        return False
+
+
+@unittest.skipUnless(redis_available(), 'Redis is not reachable')
+class DelayQueueTest(SimpleTestCase):
+    """
+    Run against a Redis for tests, claim takes due tasks of all kinds
+    """
+    kind = 'test'
+
+    def setUp(self):
+        self.keys = []
+        self.now = delay_queue._now()
+
+    def tearDown(self):
+        for kind, key in self.keys:
+            delay_queue.cancel(kind, key)
+            client.zrem(delay_queue.DELAY_DEAD, delay_queue.member(kind, key))
+
+    def schedule(self, due: int, payload=None) -> str:
+        key = uuid.uuid4().hex
+        self.keys.append((self.kind, key))
+        delay_queue.schedule(self.kind, key, due, payload)
+        return delay_queue.member(self.kind, key)
+
+    def claim(self, visibility_timeout: int = 60) -> dict:
+        members = {x for _, x in self.keys}
+        return {x.member: x for x in delay_queue.claim(1000, visibility_timeout)
+                if x.kind == self.kind and x.key in members}
+
+    def test_claim(self):
+        due = self.schedule(self.now - 1, {'a': 1})
+        later = self.schedule(self.now + 3600)
+
+        tasks = self.claim()
+        self.assertEqual(list(tasks), [due])
+        self.assertEqual(tasks[due].payload, {'a': 1})
+        self.assertNotIn(later, tasks)
+        # invisible to other workers until the visibility deadline
+        self.assertEqual(self.claim(), {})
+
+    def test_redeliver(self):
+        due = self.schedule(self.now - 1)
+        self.assertIn(due, self.claim(visibility_timeout=0))
+        # not acked before the visibility deadline
+        self.assertIn(due, self.claim())
+        self.assertEqual(int(client.hget(delay_queue.DELAY_ATTEMPTS, due)), 2)
+
+    def test_retry(self):
+        due = self.schedule(self.now - 1)
+        self.claim()
+        self.assertTrue(delay_queue.retry(due, max_attempts=3, backoff=10))
+        self.assertGreaterEqual(client.zscore(delay_queue.DELAY_QUEUE, due), self.now + 10)
+        self.assertIsNone(client.zscore(delay_queue.DELAY_PROCESSING, due))
+        self.assertEqual(self.claim(), {})
+
+    def test_dead_letter(self):
+        due = self.schedule(self.now - 1)
+        self.claim(visibility_timeout=0)
+        self.claim()
+        self.assertFalse(delay_queue.retry(due, max_attempts=2, backoff=10))
+        self.assertIn(due, delay_queue.dead_letters())
+        self.assertIsNone(client.zscore(delay_queue.DELAY_QUEUE, due))
+        self.assertIsNone(client.hget(delay_queue.DELAY_ATTEMPTS, due))
+
+    def test_ack(self):
+        due = self.schedule(self.now - 1, {'a': 1})
+        self.claim()
+        delay_queue.ack(due)
+        self.assertIsNone(client.zscore(delay_queue.DELAY_PROCESSING, due))
+        self.assertIsNone(client.zscore(delay_queue.DELAY_QUEUE, due))
+        self.assertIsNone(client.hget(delay_queue.DELAY_PAYLOAD, due))
+
+    def test_reschedule_while_processing(self):
+        due = self.schedule(self.now - 1)
+        self.claim()
+        key = self.keys[0][1]
+        delay_queue.schedule(self.kind, key, self.now + 3600, {'a': 2})
+        self.assertIsNone(client.zscore(delay_queue.DELAY_QUEUE, due))
+
+        delay_queue.ack(due)
+        self.assertEqual(client.zscore(delay_queue.DELAY_QUEUE, due), self.now + 3600)
+        self.assertEqual(client.hget(delay_queue.DELAY_PAYLOAD, due), b'{"a": 2}')
+
+    def test_ack_release_share_user(self):
+        meeting, user = uuid.uuid4().int % 10 ** 12, uuid.uuid4().int % 10 ** 12
+        self.keys.append((delay_queue.MEETING_CLOSE, meeting))
+        self.addCleanup(client.srem, SHARE_USER_KEY, user)
+        client.sadd(SHARE_USER_KEY, user)
+        delay_queue.push(meeting, self.now - 1, user)
+
+        task = [x for x in delay_queue.claim(1000, 60) if x.key == str(meeting)][0]
+        self.assertEqual(task.payload, {'share_user': user})
+        delay_queue.ack(task.member)
+        self.assertFalse(client.sismember(SHARE_USER_KEY, user))
@@ -1,6 +1,7 @@
 from django.urls import path
 
 from meeting.views import *
+from meeting_sample.settings import ASYNC_VIEWS
 
 urlpatterns = [
     path('new/', NewMeetingAPI.as_view()),
@@ -11,4 +12,15 @@ urlpatterns = [
     path('stop/', StopMeetingAPI.as_view()),
     path('start_share/', StartShareAPI.as_view()),
     path('stop_share/', StopShareAPI.as_view()),
+    path('share_heartbeat/', ShareHeartbeatAPI.as_view()),
 ]
+
+if ASYNC_VIEWS:
+    # served on the event loop under ASGI, they are matched before the APIViews of the same paths
+    from meeting.async_views import join_meeting, start_share, stop_share
+
+    urlpatterns = [
+        path('join/', join_meeting),
+        path('start_share/', start_share),
+        path('stop_share/', stop_share),
+    ] + urlpatterns
@@ -1,11 +1,18 @@
 # Create your views here.
 import datetime
+import json
 import logging
-import random
+import time
 from calendar import timegm
+from concurrent.futures import Executor
+from typing import Dict, List, Optional
 
 from django.contrib.auth.models import User
+from django.core import serializers
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction, IntegrityError
+from django.db.models import Max
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.exceptions import ValidationError, APIException, NotFound, NotAcceptable, PermissionDenied
 from rest_framework.permissions import IsAuthenticated
@@ -14,15 +21,19 @@ from rest_framework_jwt.authentication import JSONWebTokenAuthentication
 
 from meeting.models import Meeting
 from meeting.serializers import NewMeetingIn, BaseMeetingOut, MeetingInfoIn, MeetingInfoOut, MeetingListIn, \
-    NewMeetingOut, DelMeetingIn, JoinMeetingOut, JoinMeetingIn, MeetingIn
-from meeting_sample.settings import APP_KEY, APP_SECRET, LVB_HOST
+    NewMeetingOut, DelMeetingIn, JoinMeetingOut, JoinMeetingIn, MeetingIn, StartShareIn, ShareOut, \
+    StopMeetingOut
+from meeting_sample.settings import APP_KEY, APP_SECRET, LVB_HOST, CALL_NUMBER_KEY, SHARE_LEASE_TIME
 from utils import cache, lvb
+from utils.call_number import CallNumberCipher
 from utils import encryption
 from utils.errors import ERROR
 from utils.resp import r200
 
 logger = logging.getLogger(__name__)
 
+call_number_cipher = CallNumberCipher(CALL_NUMBER_KEY)
+
 
 class NewMeetingAPI(APIView):
     """
@@ -47,31 +58,47 @@ class NewMeetingAPI(APIView):
         mute_type = data_in.validated_data.pop('mute_type', Meeting.MuteType.UNMUTE)
 
         try:
-            meeting = Meeting.objects.create(**data_in.validated_data, begin_at=begin_at, end_at=end_at,
-                                             mute_type=mute_type, owner=request.user,
-                                             call_number=self.__gen_call_number(),
-                                             created=datetime.datetime.utcnow())
+            meeting = self.create_meeting(**data_in.validated_data, begin_at=begin_at, end_at=end_at,
+                                          mute_type=mute_type, owner=request.user)
         except Exception as e:
             logger.error(f'failed to create meeting: {e}')
             err = ERROR['NEW_MEETING_FAILED']
             err['data'] = str(e)
             raise APIException(err)
 
+        # the number may be cached as not found
+        MeetingInfoAPI.invalidate(meeting.call_number)
+
         out = NewMeetingOut(instance=meeting)
         logger.info(f'[NewMeetingAPI] success: {out.data}')
         return r200(out.data)
 
-    def __gen_call_number(self):
-        random.seed(datetime.datetime.utcnow().timestamp())
-        b = random.randint(1, 9)
-        o = random.randint(0, 1e8 - 1)
-        call_number = int(b * 1e8 + o)
+    @staticmethod
+    def create_meeting(retry: int = 10, **kwargs) -> Meeting:
+        """
+        Create a meeting with the call number of next sequence.
+        Sequences never repeat, but a call number may be taken by a meeting created before the sequences,
+        so try next sequence on conflict.
+        """
+        for _ in range(retry):
+            sequence = cache.next_call_sequence(NewMeetingAPI.last_call_sequence)
+            call_number = call_number_cipher.encode(sequence)
+            try:
+                with transaction.atomic():
+                    meeting = Meeting.objects.create(**kwargs, call_number=call_number, call_sequence=sequence,
+                                                     created=datetime.datetime.utcnow())
+            except IntegrityError:
+                logger.warning(f'{call_number} is exist, try next sequence')
+                continue
+            logger.info(f'generate call number:{call_number}')
+            return meeting
+        raise RuntimeError(f'failed to generate call number after {retry} retries')
 
-        if Meeting.objects.filter(call_number=call_number).count() > 0:
-            logger.warning(f'{call_number} is exist, re-generate call number')
-            return self.__gen_call_number()
-        logger.info(f'generate call number:{call_number}')
-        return call_number
+    @staticmethod
+    def last_call_sequence() -> int:
+        # include deleted meetings, their call numbers are still taken
+        last = Meeting.all_objects.aggregate(Max('call_sequence'))['call_sequence__max']
+        return last if last is not None else -1
 
 
 class DelMeetingAPI(APIView):
@@ -101,6 +128,10 @@ class DelMeetingAPI(APIView):
             err['data'] = str(e)
             raise NotFound(err)
 
+        MeetingInfoAPI.invalidate(*meeting_ids)
+        for number in meeting_ids:
+            cache.poll.invalidate_poll_list(number)
+
         logger.info('[DelMeetingAPI] success')
         out = BaseMeetingOut(instance=dict(success=True))
         return r200(out.data)
@@ -125,7 +156,7 @@ class MeetingInfoAPI(APIView):
             raise ValidationError(err)
 
         try:
-            meeting = Meeting.objects.get(call_number=data_in.validated_data['number'])
+            meeting = self.get_meeting(data_in.validated_data['number'])
         except ObjectDoesNotExist:
             logger.error(f'invalid query param: {data_in.validated_data}')
             err = ERROR['MEETING_NOT_FOUND']
@@ -141,6 +172,86 @@ class MeetingInfoAPI(APIView):
         logger.info(f'[MeetingInfoAPI] success: {out.data}')
         return r200(out.data)
 
+    @staticmethod
+    def get_meeting(number: int, wait: float = 1) -> Meeting:
+        """
+        Get a meeting with its owner from the cached snapshot, raise Meeting.DoesNotExist if not found.
+        On miss only one request reads the database, others wait for its snapshot at most wait seconds.
+        """
+        version, cached, snapshot, lock = None, False, None, None
+        try:
+            deadline = time.time() + wait
+            while True:
+                version, cached, snapshot = cache.get_meeting_snapshot(number)
+                if cached:
+                    break
+                lock = cache.lock_meeting_snapshot(number)
+                if lock is not None or time.time() > deadline:
+                    break
+                time.sleep(0.02)
+        except Exception as e:
+            logger.warning(f'failed to get meeting {number} from cache: {e}')
+
+        if not cached:
+            # database errors are raised, the lock is released anyway
+            try:
+                snapshot = MeetingInfoAPI.load_snapshot(number)
+                if version is not None:
+                    MeetingInfoAPI.cache_snapshot(number, version, snapshot)
+            finally:
+                if lock is not None:
+                    MeetingInfoAPI.unlock_snapshot(lock)
+
+        if snapshot is None:
+            raise Meeting.DoesNotExist(f'meeting not found: {number}')
+        return MeetingInfoAPI.from_snapshot(snapshot)
+
+    @staticmethod
+    def cache_snapshot(number: int, version: int, snapshot: Optional[Dict]):
+        try:
+            cache.set_meeting_snapshot(number, version, snapshot)
+        except Exception as e:
+            logger.warning(f'failed to cache meeting {number}: {e}')
+
+    @staticmethod
+    def unlock_snapshot(lock: cache.connection.Lock):
+        try:
+            cache.unlock_meeting_snapshot(lock)
+        except Exception as e:
+            logger.warning(f'failed to unlock snapshot: {lock.name}: {e}')
+
+    @staticmethod
+    def from_snapshot(snapshot: Dict) -> Meeting:
+        meeting = next(serializers.deserialize('python', [snapshot['meeting']])).object
+        if snapshot['owner'] is not None:
+            # fill the relation, so that accessing the owner needs no query
+            meeting.owner = User(**snapshot['owner'])
+        return meeting
+
+    @staticmethod
+    def load_snapshot(number: int) -> Optional[Dict]:
+        try:
+            meeting = Meeting.objects.select_related('owner').get(call_number=number)
+        except ObjectDoesNotExist:
+            return None
+        owner = None
+        if meeting.owner is not None:
+            owner = {'id': meeting.owner.id, 'username': meeting.owner.username}
+        # encode datetime as string, it's decoded by the fields when deserializing
+        data = json.loads(json.dumps(serializers.serialize('python', [meeting])[0], cls=DjangoJSONEncoder))
+        return {'meeting': data, 'owner': owner}
+
+    @staticmethod
+    def invalidate(*numbers: int):
+        """
+        Drop cached snapshots of meetings, it's called after updating the meetings
+        """
+        for number in numbers:
+            try:
+                cache.invalidate_meeting_snapshot(number)
+            except Exception as e:
+                logger.error(f'failed to invalidate snapshot of meeting {number}: {e}')
+
 
 class ListMeetingAPI(APIView):
     """
@@ -189,29 +300,79 @@ class JoinMeetingAPI(APIView):
     def post(self, request, *args, **kwargs):
         logger.info(f'[JoinMeetingAPI] user: {request.user.id} join meeting: {request.data}')
 
-        data_in = JoinMeetingIn(data=request.data)
+        data = self.validate(request.data)
+        number = data['number']
+
+        try:
+            meeting = MeetingInfoAPI.get_meeting(number)
+        except ObjectDoesNotExist:
+            raise self.not_found(number)
+
+        self.check_join(meeting, data)
+
+        if meeting.status == Meeting.RoomStatus.NEW:
+            self.start(meeting)
+
+        try:
+            _, group_info = cache.lookup_meeting(meeting.call_number)
+        except Exception as e:
+            raise self.group_info_failed(e)
+
+        out = JoinMeetingOut(instance=self.join_info(meeting, request.user.id, group_info))
+        logger.info(f'[JoinMeetingAPI] success: {out.data}')
+        return r200(out.data)
+
+    # The steps below are shared with the async view, which only does the cache I/O on the event loop
+
+    @staticmethod
+    def validate(data: Dict) -> Dict:
+        data_in = JoinMeetingIn(data=data)
         if not data_in.is_valid():
             logger.error(data_in.errors)
             err = ERROR['MEETING_INPUT']
             err['data'] = data_in.errors
             raise ValidationError(err)
-        number = data_in.validated_data['number']
+        return data_in.validated_data
+
+    @staticmethod
+    def not_found(number: int) -> NotFound:
+        logger.error(f'invalid meeting number: {number}')
+        err = ERROR['MEETING_NOT_FOUND']
+        err['data'] = f'meeting number: {number}'
+        return NotFound(err)
 
+    @staticmethod
+    def start(meeting: Meeting):
+        """
+        Start the NEW meeting joined, and fill its share user
+        """
         try:
-            meeting = Meeting.objects.get(call_number=number)
-        except ObjectDoesNotExist:
-            logger.error(f'invalid meeting number: {number}')
-            err = ERROR['MEETING_NOT_FOUND']
-            err['data'] = f'meeting number: {number}'
-            raise NotFound(err)
+            meeting.share_user_id = JoinMeetingAPI.start_meeting(meeting)
+        except Exception as e:
+            logger.error(f'failed to update meeting status: {e}')
+            err = ERROR['MEETING_INFO_DATABASE']
+            err['data'] = str(e)
+            raise APIException(err)
+
+    @staticmethod
+    def group_info_failed(e: Exception) -> APIException:
+        logger.error(f'failed to get group info: {e}')
+        err = ERROR['INTERNAL']
+        err['data'] = 'failed to get group info'
+        return APIException(err)
 
+    @staticmethod
+    def check_join(meeting: Meeting, data: Dict):
+        """
+        Raise the error if the user can't join the meeting with the password now
+        """
         if meeting.password is not None:
-            if 'password' not in data_in.validated_data:
+            if 'password' not in data:
                 logger.error('need password')
                 err = ERROR['MEETING_INPUT']
                 err['data'] = 'need password'
                 raise ValidationError(err)
-            if meeting.password != data_in.validated_data['password']:
+            if meeting.password != data['password']:
                 logger.error('invalid meeting password')
                 err = ERROR['INVALID_PASSWORD']
                 err['data'] = 'password not match'
@@ -229,47 +390,53 @@ class JoinMeetingAPI(APIView):
             err['data'] = f'meeting is not start: {meeting.begin_at}'
             raise APIException(err)
 
+    @staticmethod
+    def join_info(meeting: Meeting, user_id: int, group_info: Optional[List[Dict]]) -> Dict:
+        """
+        LVB tokens of the user and the share user to join the room
+        """
         tm_now = timegm(datetime.datetime.utcnow().utctimetuple())
         duration = int((meeting.end_at - meeting.begin_at).total_seconds())
-        token_src = f'{APP_KEY}_{meeting.call_number}_{request.user.id}_{duration}_{tm_now}'
-        lvb_token = encryption.encode(APP_SECRET, token_src)
+        token_src = f'{APP_KEY}_{meeting.call_number}_{user_id}_{duration}_{tm_now}'
+        share_user_token_src = f'{APP_KEY}_{meeting.call_number}_{meeting.share_user_id}_{duration}_{tm_now}'
+        return dict(token=encryption.encode(APP_SECRET, token_src), app_key=APP_KEY,
+                    room_id=meeting.call_number,
+                    share_user_id=meeting.share_user_id,
+                    share_user_token=encryption.encode(APP_SECRET, share_user_token_src),
+                    is_breakout=group_info is not None)
 
-        if meeting.status == Meeting.RoomStatus.NEW:
-            meeting.share_user_id = cache.share_user.generate()
-            try:
+    @staticmethod
+    def start_meeting(meeting: Meeting) -> int:
+        """
+        Move the meeting from NEW to ONGOING by the first participant, return the share user ID.
+        Participants join at the same time wait for the row lock, only the winner reserves a share user ID
+        and opens the meeting in cache, others use the winner's.
+        """
+        number = meeting.call_number
+        share_user_id = None
+        try:
+            with transaction.atomic():
+                status, started_by = Meeting.objects.select_for_update(). \
+                    values_list('status', 'share_user_id').get(call_number=number)
+                if status != Meeting.RoomStatus.NEW:
+                    logger.info(f'meeting {number} is started by others')
+                    return started_by
+                share_user_id = cache.share_user.generate()
                 Meeting.objects.filter(call_number=number). \
                     update(status=Meeting.RoomStatus.ONGOING,
                            actually_begin_at=datetime.datetime.utcnow(),
-                           share_user_id=meeting.share_user_id)
-            except Exception as e:
-                logger.error(f'failed to update meeting status: {e}')
-                err = ERROR['MEETING_INFO_DATABASE']
-                err['data'] = str(e)
-                raise APIException(err)
-
-            ex = meeting.end_at - datetime.datetime.utcnow() + datetime.timedelta(seconds=60)
-            cache.open_meeting(number, ex)
-            cache.delay_queue.push(number, int(meeting.end_at.timestamp()))
-            logger.info(f'start meeting in cache')
-
-        try:
-            group_info = cache.group.get_group_info(meeting.call_number)
-        except Exception as e:
-            logger.error(f'failed to get group info: {e}')
-            err = ERROR['INTERNAL']
-            err['data'] = 'failed to get group info'
-            raise APIException(err)
+                           share_user_id=share_user_id)
+        except Exception:
+            if share_user_id is not None:
+                cache.share_user.remove(share_user_id)
+            raise
 
-        share_user_token_src = f'{APP_KEY}_{meeting.call_number}_{meeting.share_user_id}_{duration}_{tm_now}'
-        share_user_token = encryption.encode(APP_SECRET, share_user_token_src)
-        out = JoinMeetingOut(instance=dict(token=lvb_token, app_key=APP_KEY,
-                                           room_id=meeting.call_number,
-                                           share_user_id=meeting.share_user_id,
-                                           share_user_token=share_user_token,
-                                           is_breakout=group_info is not None
-                                           ))
-        logger.info(f'[JoinMeetingAPI] success: {out.data}')
-        return r200(out.data)
+        ex = meeting.end_at - datetime.datetime.utcnow() + datetime.timedelta(seconds=60)
+        cache.open_meeting(number, int(ex.total_seconds()), int(meeting.end_at.timestamp()), share_user_id)
+        MeetingInfoAPI.invalidate(number)
+        cache.poll.invalidate_poll_list(number)
+        logger.info(f'start meeting in cache')
+        return share_user_id
 
 
 class StopMeetingAPI(APIView):
@@ -291,18 +458,19 @@ class StopMeetingAPI(APIView):
             raise ValidationError(err)
         number = data_in.validated_data['number']
 
-        try:
-            stopped = self.stop_meeting(number, request.user)
-        except Exception as e:
-            logger.error(f'failed to stop meeting: {e}')
+        status = self.close_meeting(number, request.user)
 
-        out = BaseMeetingOut(dict(success=stopped))
+        out = StopMeetingOut(dict(success=True, status=status))
         logger.info(f'[StopMeetingAPI] success: {out.data}')
         return r200(out.data)
 
     @staticmethod
-    def stop_meeting(number: int, invoker: User) -> bool:
-        stopped = True
+    def close_meeting(number: int, invoker: Optional[User]) -> int:
+        """
+        Accept to stop the meeting: mark it CLOSING and push it to the delay queue due now,
+        the delay task closes LVB room and cache, and retries until success. Return status of the meeting.
+        The CLOSING row is durable, the delay task pushes it again if the queue is lost.
+        """
         try:
             meeting = Meeting.objects.get(call_number=number)
         except ObjectDoesNotExist:
@@ -311,29 +479,85 @@ class StopMeetingAPI(APIView):
             err['data'] = f'meeting number: {number}'
             raise NotFound(err)
 
-        if invoker is not None and meeting.owner != invoker:
+        if invoker is not None and meeting.owner_id != invoker.id:
             logger.error(f'no permission to stop meeting')
             err = ERROR['NOT_PERMISSION_STOP']
-            err['data'] = f'owner ID: {meeting.owner.id}'
+            err['data'] = f'owner ID: {meeting.owner_id}'
             raise PermissionDenied(err)
 
-        if meeting.status != Meeting.RoomStatus.CLOSED:
-            if StopMeetingAPI.stop_lvb_room(meeting, number):
-                try:
-                    Meeting.objects.filter(call_number=number). \
-                        update(status=Meeting.RoomStatus.CLOSED,
-                               closed_by=invoker,
-                               actually_end_at=datetime.datetime.utcnow())
-                except Exception as e:
-                    logger.error(f'failed to update meeting status: {e}')
-                    err = ERROR['MEETING_INFO_DATABASE']
-                    err['data'] = str(e)
-                    raise APIException(err)
-
-        # if call LVB error, stop it again
-        if cache.is_meeting_open(number):
-            stopped = StopMeetingAPI.stop_lvb_room(meeting, number)
-        return stopped
+        try:
+            closing = Meeting.objects. \
+                filter(call_number=number, status__in=[Meeting.RoomStatus.NEW, Meeting.RoomStatus.ONGOING]). \
+                update(status=Meeting.RoomStatus.CLOSING, closed_by=invoker)
+        except Exception as e:
+            logger.error(f'failed to update meeting status: {e}')
+            err = ERROR['MEETING_INFO_DATABASE']
+            err['data'] = str(e)
+            raise APIException(err)
+
+        if not closing:
+            # closed or closing already, a closed meeting may be still open in cache if LVB failed
+            if meeting.status == Meeting.RoomStatus.CLOSED and not cache.is_meeting_open(number):
+                return meeting.status
+        else:
+            MeetingInfoAPI.invalidate(number)
+            cache.poll.invalidate_poll_list(number)
+
+        cache.delay_queue.push(number, int(datetime.datetime.utcnow().timestamp()), meeting.share_user_id)
+        return Meeting.RoomStatus.CLOSING
+
+    @staticmethod
+    def stop_meeting(number: int) -> bool:
+        """
+        Close LVB room and cache of the meeting. Return False to retry later.
+        """
+        return StopMeetingAPI.stop_meetings([number])[number]
+
+    @staticmethod
+    def stop_meetings(numbers: List[int], executor: Optional[Executor] = None) -> Dict[int, bool]:
+        """
+        Close LVB rooms and cache of meetings, it's called by the delay task for the meetings due or accepted
+        to stop. Meetings are read in one query, LVB rooms are stopped concurrently by executor, and status
+        is updated in one query. Return {meeting number: closed}, not closed meetings should be retried later.
+        """
+        meetings = Meeting.objects.select_related('owner').in_bulk(numbers)
+        result = {}
+        to_stop = []
+        for number in numbers:
+            meeting = meetings.get(number)
+            if meeting is None:
+                logger.warning(f'meeting {number} not found, drop it from delay queue')
+                result[number] = True
+            elif meeting.status == Meeting.RoomStatus.CLOSED and not cache.is_meeting_open(number):
+                result[number] = True
+            else:
+                to_stop.append(meeting)
+
+        def stop(meeting: Meeting) -> bool:
+            try:
+                return StopMeetingAPI.stop_lvb_room(meeting, meeting.call_number)
+            except Exception as e:
+                logger.warning(f'failed to stop meeting {meeting.call_number}: {e}')
+                return False
+
+        if executor is not None:
+            stopped = list(executor.map(stop, to_stop))
+        else:
+            stopped = [stop(x) for x in to_stop]
+
+        closed = []
+        for meeting, success in zip(to_stop, stopped):
+            result[meeting.call_number] = success
+            if success and meeting.status != Meeting.RoomStatus.CLOSED:
+                closed.append(meeting.call_number)
+
+        if closed:
+            Meeting.objects.filter(call_number__in=closed).exclude(status=Meeting.RoomStatus.CLOSED). \
+                update(status=Meeting.RoomStatus.CLOSED, actually_end_at=datetime.datetime.utcnow())
+            MeetingInfoAPI.invalidate(*closed)
+            for number in closed:
+                cache.poll.invalidate_poll_list(number)
+        return result
 
     @staticmethod
     def stop_lvb_room(meeting: Meeting, number: int) -> bool:
@@ -354,9 +578,6 @@ class StopMeetingAPI(APIView):
             logger.info(f'success: {sts}, close lvb room: {lvb_room_id}')
 
         cache.close_meeting(number)
-        cache.delay_queue.pop(number)
-        cache.share_user.remove(meeting.share_user_id)
-        cache.group.close_group(meeting.call_number)
         logger.info(f'stop meeting in cache')
         return True
 
@@ -368,34 +589,98 @@ class StartShareAPI(APIView):
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
-    @swagger_auto_schema(request_body=MeetingIn, responses={200: BaseMeetingOut}, tags=['meeting'])
+    @swagger_auto_schema(request_body=StartShareIn, responses={200: ShareOut}, tags=['meeting'])
     def post(self, request, *args, **kwargs):
         logger.info(f'[StartShareAPI] user: {request.user.id} request to start share: {request.data}')
 
-        data_in = MeetingIn(data=request.data)
+        data_in = StartShareIn(data=request.data)
         if not data_in.is_valid():
             logger.error(data_in.errors)
             err = ERROR['MEETING_INPUT']
             err['data'] = data_in.errors
             raise ValidationError(err)
         number = data_in.validated_data['number']
+        wait = data_in.validated_data['wait']
+
+        # take the lease, or wait for the sharing user to release it
+        deadline = time.time() + wait
+        while True:
+            share_user, ttl = cache.acquire_share(number, request.user.id, SHARE_LEASE_TIME * 1000)
+            timeout = self.wait_time(deadline, share_user, ttl)
+            if timeout is None:
+                break
+            if timeout > 0:
+                cache.wait_share(number, timeout)
+
+        self.check_acquired(number, share_user)
+
+        # wake up the waiting users if the lease expires without release
+        cache.delay_queue.schedule_after(cache.delay_queue.SHARE_EXPIRE, number, SHARE_LEASE_TIME + 1,
+                                         {'user': request.user.id})
+
+        out = ShareOut(instance=dict(success=True, lease=SHARE_LEASE_TIME))
+        logger.info(f'[StartShareAPI] success: meeting: {number}, user: {request.user.id}')
+        return r200(out.data)
 
-        share_user = cache.get_sharing_user(number)
+    @staticmethod
+    def wait_time(deadline: float, share_user: int, ttl: int) -> Optional[float]:
+        """
+        Seconds to wait for the lease after failing to take it, None if the lease is taken or no time left.
+        share_user and ttl are returned by acquiring the lease.
+        """
+        if share_user <= 0:
+            return None
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        return min(remaining, ttl / 1000) if ttl > 0 else 0
+
+    @staticmethod
+    def check_acquired(number: int, share_user: int):
+        """
+        Raise the error if the lease is not taken, share_user is returned by acquiring the lease
+        """
         if -1 == share_user:
             logger.error(f'meeting: {number} not start')
             err = ERROR['MEETING_NOT_FOUND']
             err['data'] = 'not found ongoing meeting'
             raise NotFound(err)
 
-        if share_user > 0 and share_user != request.user.id:
+        if share_user > 0:
             err = ERROR['IS_SHARED']
             err['data'] = f'user {share_user} is sharing'
             raise NotAcceptable(err)
 
-        cache.start_share(number, request.user.id)
 
-        out = BaseMeetingOut(instance=dict(success=True))
-        logger.info(f'[StartShareAPI] success: meeting: {number}, user: {request.user.id}')
+class ShareHeartbeatAPI(APIView):
+    """
+    Sharing user renew the share lease, it should be called within the lease
+    """
+    authentication_classes = (JSONWebTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    @swagger_auto_schema(request_body=MeetingIn, responses={200: ShareOut}, tags=['meeting'])
+    def post(self, request, *args, **kwargs):
+        logger.debug(f'[ShareHeartbeatAPI] user: {request.user.id} renew share: {request.data}')
+
+        data_in = MeetingIn(data=request.data)
+        if not data_in.is_valid():
+            logger.error(data_in.errors)
+            err = ERROR['MEETING_INPUT']
+            err['data'] = data_in.errors
+            raise ValidationError(err)
+        number = data_in.validated_data['number']
+
+        if not cache.renew_share(number, request.user.id, SHARE_LEASE_TIME * 1000):
+            logger.warning(f'user {request.user.id} lost share lease of meeting {number}')
+            err = ERROR['NOT_SHARE']
+            err['data'] = f'sharing user is {cache.get_sharing_user(number)}'
+            raise PermissionDenied(err)
+
+        cache.delay_queue.schedule_after(cache.delay_queue.SHARE_EXPIRE, number, SHARE_LEASE_TIME + 1,
+                                         {'user': request.user.id})
+
+        out = ShareOut(instance=dict(success=True, lease=SHARE_LEASE_TIME))
         return r200(out.data)
 
 
@@ -418,14 +703,14 @@ class StopShareAPI(APIView):
             raise ValidationError(err)
         number = data_in.validated_data['number']
 
-        share_user = cache.get_sharing_user(number)
-        if share_user != request.user.id:
+        if not cache.release_share(number, request.user.id):
+            share_user = cache.get_sharing_user(number)
             logger.error(f'share user not match request user')
             err = ERROR['NOT_SHARE']
             err['data'] = f'sharing user is {share_user}'
             raise PermissionDenied(err)
 
-        cache.stop_share(number)
+        cache.delay_queue.cancel(cache.delay_queue.SHARE_EXPIRE, number)
 
         out = BaseMeetingOut(instance=dict(success=True))
         logger.info(f'[StopShareAPI] success: {out.data}')
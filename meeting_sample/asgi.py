@@ -13,8 +13,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meeting_sample.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
 
-from delay_task.views import start_delay_task
+from delay_task.views import start_delay_task, start_vote_flush_task
+from meeting_sample.settings import EMBEDDED_SCHEDULER
+from poll.stream import STREAM_PATH, poll_stream
 
-start_delay_task()
+
+async def application(scope, receive, send):
+    # the poll stream holds the connection open, serve it outside of Django views
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        await poll_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
+
+
+# disabled when the tasks run by `manage.py run_scheduler`
+if EMBEDDED_SCHEDULER:
+    start_delay_task()
+    start_vote_flush_task()
@@ -16,3 +16,29 @@ REDIS_PREFIX = os.getenv('REDIS_PREFIX', '0')
 SENTRY_DSN = os.getenv('SENTRY_DSN', 'http://f198a73df01344e48da8aa8511598bf7@192.168.7.77:9000/4')
 
 LVB_HOST = os.getenv('LVB_HOST', None)
+LVB_CONNECT_TIMEOUT = float(os.getenv('LVB_CONNECT_TIMEOUT', 3))
+LVB_READ_TIMEOUT = float(os.getenv('LVB_READ_TIMEOUT', 10))
+LVB_POOL_SIZE = int(os.getenv('LVB_POOL_SIZE', 10))
+
+# Key to permute the sequence into call numbers, changing it may lead to collisions with existing meetings
+CALL_NUMBER_KEY = os.getenv('CALL_NUMBER_KEY', 'meeting-sample')
+
+# Seconds of screen share lease, the sharing user renews it by heartbeat
+SHARE_LEASE_TIME = int(os.getenv('SHARE_LEASE_TIME', 30))
+
+# Write-behind mode of poll commit, ballots are buffered in Redis and persisted by a worker
+POLL_WRITE_BEHIND = (os.getenv('POLL_WRITE_BEHIND', 'false').lower() == 'true')
+POLL_BUFFER_LIMIT = int(os.getenv('POLL_BUFFER_LIMIT', 100000))
+POLL_FLUSH_BATCH = int(os.getenv('POLL_FLUSH_BATCH', 1000))
+
+# Run the delay task and vote flush task in the web process, disable it when they run by `manage.py run_scheduler`
+EMBEDDED_SCHEDULER = (os.getenv('EMBEDDED_SCHEDULER', 'true').lower() == 'true')
+# Scheduled tasks processed at the same time, such as LVB rooms to stop
+SCHEDULER_CONCURRENCY = int(os.getenv('SCHEDULER_CONCURRENCY', 16))
+
+# Serve the hot endpoints by async views under ASGI, the APIViews serve them on Redis cluster
+# which is not supported by the asyncio client
+ASYNC_VIEWS = (os.getenv('ASYNC_VIEWS', 'false').lower() == 'true') and not REDIS_CLUSTER_ENABLED
+ASYNC_REDIS_POOL_SIZE = int(os.getenv('ASYNC_REDIS_POOL_SIZE', 256))
+# Requests waiting for the share lease at the same time, each one holds a Redis connection while waiting
+ASYNC_SHARE_WAITERS = int(os.getenv('ASYNC_SHARE_WAITERS', 256))
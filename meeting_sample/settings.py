@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'meeting',
     'poll',
     'group',
+    'delay_task',
 ]
 
 MIDDLEWARE = [
@@ -15,6 +15,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meeting_sample.settings')
 
 application = get_wsgi_application()
 
-from delay_task.views import start_delay_task
+from delay_task.views import start_delay_task, start_vote_flush_task
+from meeting_sample.settings import EMBEDDED_SCHEDULER
 
-start_delay_task()
+# disabled when the tasks run by `manage.py run_scheduler`
+if EMBEDDED_SCHEDULER:
+    start_delay_task()
+    start_vote_flush_task()
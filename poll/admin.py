@@ -2,7 +2,7 @@ from django.contrib import admin
 from safedelete.admin import SafeDeleteAdmin
 
 # Register your models here.
-from poll.models import Poll, PollQuestion, PollOption, PollResult
+from poll.models import Poll, PollQuestion, PollOption, PollResult, PollBallot, PollRoundResult
 
 
 @admin.register(Poll)
@@ -30,3 +30,15 @@ class PollResultAdmin(SafeDeleteAdmin):
 
     def voter(self, obj):
         return [x.nickname for x in obj.voters.all()]
+
+
+@admin.register(PollBallot)
+class PollBallotAdmin(admin.ModelAdmin):
+    list_display = ('id', 'poll', 'round', 'voter', 'created')
+    readonly_fields = ('id',)
+
+
+@admin.register(PollRoundResult)
+class PollRoundResultAdmin(admin.ModelAdmin):
+    list_display = ('id', 'poll', 'round', 'created')
+    readonly_fields = ('id',)
@@ -0,0 +1,75 @@
+"""
+Async variants of the hot poll APIs, routed instead of the APIViews when ASYNC_VIEWS is enabled
+"""
+import logging
+from typing import Dict
+
+from meeting_sample.settings import POLL_WRITE_BEHIND, POLL_BUFFER_LIMIT
+from poll.models import Poll
+from poll.serializers import PollCommitOut
+from poll.views import PollCommitAPI
+from utils.async_view import async_api, db_sync_to_async
+from utils.cache import aio
+from utils.resp import r200
+
+logger = logging.getLogger(__name__)
+
+
+async def publish_event(poll_id: int, event: str, data: Dict):
+    """
+    Push an event to the streams of the poll on the event loop
+    """
+    try:
+        await aio.publish_event(poll_id, event, data)
+    except Exception as e:
+        logger.warning(f'failed to publish event {event} of poll {poll_id}: {e}')
+
+
+@async_api()
+async def poll_commit(request):
+    logger.info(f'[poll_commit] user:{request.user.id} commit poll: {request.data}')
+
+    poll_id, replace, options = PollCommitAPI.validate(request.data)
+    poll = await db_sync_to_async(PollCommitAPI.get_poll)(poll_id)
+    voter = request.user.id
+    option_ids = [o_id for _, o_id in options]
+
+    # admit one ballot per voter in cache, the unique constraint of database is the backstop
+    admitted, old = None, None
+    try:
+        admitted, old = await aio.cast_ballot(poll_id, poll.round, voter, option_ids, replace)
+    except Exception as e:
+        logger.warning(f'failed to admit ballot of poll {poll_id} in cache: {e}')
+    PollCommitAPI.check_admitted(poll, voter, admitted)
+
+    try:
+        await save_ballot(poll, voter, options, replace)
+    except Exception:
+        if admitted:
+            try:
+                await aio.withdraw_ballot(poll_id, poll.round, voter, option_ids, old)
+            except Exception as e:
+                logger.warning(f'failed to withdraw ballot of poll {poll_id} in cache: {e}')
+        raise
+
+    await publish_event(poll_id, 'vote', PollCommitAPI.vote_event(poll, option_ids, old))
+
+    out = PollCommitOut(instance={'poll_id': poll_id, 'round': poll.round})
+    logger.info(f'[poll_commit] success: {out.data}')
+    return r200(out.data)
+
+
+async def save_ballot(poll: Poll, voter: int, options, replace: bool):
+    """
+    Buffer the ballot on the event loop in write-behind mode, otherwise save it to database in a thread
+    """
+    if POLL_WRITE_BEHIND:
+        try:
+            buffered = await aio.buffer_ballot(poll.id, poll.round, voter, options, POLL_BUFFER_LIMIT, replace)
+        except Exception as e:
+            logger.warning(f'failed to buffer ballot, write it to database: {e}')
+        else:
+            PollCommitAPI.check_buffered(poll, buffered)
+            return
+
+    await db_sync_to_async(PollCommitAPI.write_ballot)(poll, voter, options, replace)
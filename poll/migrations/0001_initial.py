@@ -0,0 +1,78 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('meeting', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Poll',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(editable=False, null=True)),
+                ('title', models.CharField(max_length=200)),
+                ('round', models.IntegerField(default=0, help_text='how many times do this poll')),
+                ('status', models.IntegerField(choices=[(0, 'New'), (1, 'Ongoing'), (2, 'Done')], default=0)),
+                ('is_anonymous', models.BooleanField(default=True)),
+                ('share', models.BooleanField(choices=[(False, 'Stop'), (True, 'Start')], default=False)),
+                ('meeting', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='meeting.meeting')),
+            ],
+            options={
+                'db_table': 'poll',
+            },
+        ),
+        migrations.CreateModel(
+            name='PollOption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(editable=False, null=True)),
+                ('content', models.TextField()),
+            ],
+            options={
+                'db_table': 'poll_option',
+            },
+        ),
+        migrations.CreateModel(
+            name='PollQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(editable=False, null=True)),
+                ('content', models.TextField()),
+                ('is_single', models.BooleanField(default=True)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poll.poll')),
+            ],
+            options={
+                'db_table': 'poll_question',
+            },
+        ),
+        migrations.CreateModel(
+            name='PollResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deleted', models.DateTimeField(editable=False, null=True)),
+                ('round', models.IntegerField(default=0)),
+                ('option', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='poll.polloption')),
+                ('poll', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='poll.poll')),
+                ('question', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='poll.pollquestion')),
+                ('voter', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'poll_result',
+            },
+        ),
+        migrations.AddField(
+            model_name='polloption',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poll.pollquestion'),
+        ),
+    ]
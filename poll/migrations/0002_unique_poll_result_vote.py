@@ -0,0 +1,34 @@
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def remove_duplicated_votes(apps, schema_editor):
+    """
+    Keep one row of each vote committed more than once before the constraint, an active row is preferred
+    """
+    PollResult = apps.get_model('poll', 'PollResult')
+    duplicated = PollResult.objects.values('poll_id', 'round', 'voter_id', 'option_id') \
+        .annotate(count=Count('id')).filter(count__gt=1)
+    for vote in duplicated.iterator():
+        vote.pop('count')
+        if None in vote.values():
+            # NULL never violates the constraint
+            continue
+        rows = PollResult.objects.filter(**vote).order_by(F('deleted').asc(nulls_first=True), 'id')
+        keep = rows.values_list('id', flat=True)[0]
+        rows.exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicated_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pollresult',
+            constraint=models.UniqueConstraint(fields=('poll', 'round', 'voter', 'option'), name='unique_poll_result_vote'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('poll', '0002_unique_poll_result_vote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollBallot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round', models.IntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poll.poll')),
+                ('voter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'poll_ballot',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pollballot',
+            constraint=models.UniqueConstraint(fields=('poll', 'round', 'voter'), name='unique_poll_ballot_voter'),
+        ),
+    ]
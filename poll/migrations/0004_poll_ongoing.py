@@ -0,0 +1,37 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+def flag_ongoing_polls(apps, schema_editor):
+    """
+    Flag the ongoing polls, only the latest one of a meeting if more were started before the constraint,
+    the others are left ongoing without the flag and can still be stopped
+    """
+    Poll = apps.get_model('poll', 'Poll')
+    ongoing = Poll.objects.filter(status=1, deleted__isnull=True)
+    latest = {}
+    for poll_id, meeting_id in ongoing.order_by('id').values_list('id', 'meeting_id').iterator():
+        # NULL meetings never violate the constraint
+        latest[meeting_id if meeting_id is not None else -poll_id] = poll_id
+    Poll.objects.filter(id__in=list(latest.values())).update(ongoing=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0003_pollballot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='ongoing',
+            field=models.BooleanField(default=None, editable=False, null=True),
+        ),
+        migrations.RunPython(flag_ongoing_polls, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='poll',
+            constraint=models.UniqueConstraint(fields=('meeting', 'ongoing'), name='unique_ongoing_poll'),
+        ),
+    ]
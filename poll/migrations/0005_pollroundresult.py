@@ -0,0 +1,31 @@
+# Generated by Django 3.2.6 on 2026-10-18 03:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('poll', '0004_poll_ongoing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollRoundResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round', models.IntegerField()),
+                ('result', models.JSONField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='poll.poll')),
+            ],
+            options={
+                'db_table': 'poll_round_result',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pollroundresult',
+            constraint=models.UniqueConstraint(fields=('poll', 'round'), name='unique_poll_round_result'),
+        ),
+    ]
@@ -25,9 +25,14 @@ class Poll(SafeDeleteModel):
     status = models.IntegerField(choices=Status.choices, default=Status.NEW.value)
     is_anonymous = models.BooleanField(default=True)
     share = models.BooleanField(choices=ShareStatus.choices, default=ShareStatus.STOP.value)
+    # True when ongoing, otherwise NULL which is not limited by the unique constraint
+    ongoing = models.BooleanField(null=True, default=None, editable=False)
 
     class Meta:
         db_table = 'poll'
+        constraints = [
+            models.UniqueConstraint(fields=['meeting', 'ongoing'], name='unique_ongoing_poll'),
+        ]
 
     def __str__(self):
         return self.title
@@ -71,3 +76,38 @@ class PollResult(SafeDeleteModel):
 
     class Meta:
         db_table = 'poll_result'
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'round', 'voter', 'option'], name='unique_poll_result_vote'),
+        ]
+
+
+class PollBallot(models.Model):
+    """
+    One ballot per voter in a round of poll, votes of the ballot are saved in PollResult
+    """
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
+    round = models.IntegerField(default=0)
+    voter = models.ForeignKey(User, on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'poll_ballot'
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'round', 'voter'], name='unique_poll_ballot_voter'),
+        ]
+
+
+class PollRoundResult(models.Model):
+    """
+    Immutable result of a round, saved when the round is stopped
+    """
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE)
+    round = models.IntegerField()
+    result = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'poll_round_result'
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'round'], name='unique_poll_round_result'),
+        ]
@@ -19,9 +19,12 @@ class PollListOut(serializers.ModelSerializer):
 
     class Meta:
         model = Poll
-        exclude = ('deleted', 'round', 'meeting')
+        exclude = ('deleted', 'round', 'meeting', 'ongoing')
 
     def get_question_count(self, obj):
+        # annotated by the query of poll list
+        if hasattr(obj, 'question_count'):
+            return obj.question_count
         return PollQuestion.objects.filter(poll=obj).count()
 
 
@@ -61,7 +64,7 @@ class PollDetailOut(serializers.ModelSerializer):
 
     class Meta:
         model = Poll
-        exclude = ('deleted', 'round')
+        exclude = ('deleted', 'round', 'ongoing')
 
 
 class PollNewIn(serializers.ModelSerializer):
@@ -70,7 +73,7 @@ class PollNewIn(serializers.ModelSerializer):
 
     class Meta:
         model = Poll
-        exclude = ('id', 'meeting', 'deleted', 'round', 'status', 'share')
+        exclude = ('id', 'meeting', 'deleted', 'round', 'status', 'share', 'ongoing')
 
 
 class PollUpdateIn(serializers.ModelSerializer):
@@ -92,6 +95,14 @@ class PollIn(serializers.Serializer):
         pass
 
 
+class PollStartIn(PollIn):
+    duration = serializers.IntegerField(required=False, min_value=1, help_text='Seconds to stop the poll automatically')
+
+
+class PollResultIn(PollIn):
+    round = serializers.IntegerField(required=False, help_text='Round of poll, the current round by default')
+
+
 class Voter(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -160,6 +171,7 @@ class PollCommitQuestion(serializers.Serializer):
 class PollCommitIn(serializers.Serializer):
     poll_id = serializers.IntegerField(help_text='Poll ID')
     questions = serializers.ListField(child=PollCommitQuestion())
+    replace = serializers.BooleanField(default=False, help_text='Change my ballot committed in this round')
 
     def create(self, validated_data):
         pass
@@ -182,7 +194,7 @@ class PollCommitOut(serializers.Serializer):
 class PollStartOut(serializers.ModelSerializer):
     class Meta:
         model = Poll
-        exclude = ('deleted',)
+        exclude = ('deleted', 'ongoing')
 
 
 class OptionAnswer(serializers.Serializer):
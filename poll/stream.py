@@ -0,0 +1,185 @@
+"""
+Server-Sent Events stream of poll events, served by ASGI directly.
+
+Each process keeps one subscription of the poll event channel in Redis,
+and fans out the events to all streams connected to the process.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import close_old_connections
+from djangorestframework_camel_case.util import camelize
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+
+from poll.models import Poll
+from poll.views import PollResultAPI
+from utils import cache
+from utils.errors import ERROR
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = '/api/poll/stream/'
+KEEPALIVE_INTERVAL = 15  # seconds
+QUEUE_SIZE = 256
+
+
+class PollBroadcaster:
+    """
+    Fan out events from one Redis subscription to the queues of connected streams
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._thread = None
+
+    def subscribe(self, poll_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._listeners.setdefault(poll_id, set()).add((asyncio.get_event_loop(), queue))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='Poll Broadcaster', daemon=True)
+                self._thread.start()
+        return queue
+
+    def unsubscribe(self, poll_id: int, queue: asyncio.Queue):
+        with self._lock:
+            listeners = self._listeners.get(poll_id, set())
+            listeners.difference_update([x for x in listeners if x[1] is queue])
+            if not listeners:
+                self._listeners.pop(poll_id, None)
+
+    def _run(self):
+        logger.info('poll broadcaster started')
+        while True:
+            try:
+                pubsub = cache.poll.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(cache.poll.POLL_EVENT_CHANNEL)
+                for message in pubsub.listen():
+                    self._dispatch(json.loads(message['data']))
+            except Exception as e:
+                logger.warning(f'poll broadcaster lost subscription: {e}')
+                time.sleep(1)
+
+    def _dispatch(self, event: Dict):
+        with self._lock:
+            listeners = list(self._listeners.get(event['poll'], ()))
+        for loop, queue in listeners:
+            loop.call_soon_threadsafe(self._put, queue, event)
+
+    @staticmethod
+    def _put(queue: asyncio.Queue, event: Dict):
+        if queue.full():
+            # the client is too slow, let it reload the result instead of applying deltas
+            while not queue.empty():
+                queue.get_nowait()
+            event = {'poll': event['poll'], 'event': 'overflow', 'data': {}}
+        queue.put_nowait(event)
+
+
+broadcaster = PollBroadcaster()
+
+
+def _authorize(token: Optional[str], poll_id: int) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """
+    Return (error, poll information), only the host can watch a poll not shared
+    """
+    close_old_connections()
+    try:
+        payload = api_settings.JWT_DECODE_HANDLER(token)
+        user = JSONWebTokenAuthentication().authenticate_credentials(payload)
+    except Exception as e:
+        logger.warning(f'invalid token to stream poll {poll_id}: {e}')
+        return {**ERROR['TOKEN_INVALID'], 'status': 401}, None
+
+    try:
+        poll = Poll.objects.select_related('meeting').get(id=poll_id)
+    except ObjectDoesNotExist:
+        return {**ERROR['POLL_NOT_FOUND'], 'data': f'invalid poll ID: {poll_id}', 'status': 404}, None
+
+    is_host = poll.meeting is not None and poll.meeting.owner_id == user.id
+    if not is_host and not poll.share:
+        return {**ERROR['NO_PERMISSION'], 'data': 'poll result is not shared', 'status': 403}, None
+
+    result = None
+    if poll.status != Poll.Status.NEW.value:
+        result = PollResultAPI.result(poll, poll.round)
+    close_old_connections()
+    return None, {'is_host': is_host, 'result': result}
+
+
+def _event(name: str, data) -> bytes:
+    return f'event: {name}\ndata: {json.dumps(camelize(data))}\n\n'.encode()
+
+
+async def poll_stream(scope, receive, send):
+    """
+    ASGI application of the stream: GET /api/poll/stream/?id=<poll ID>&token=<JWT>
+    """
+    params = parse_qs(scope['query_string'].decode())
+    token = params.get('token', [None])[0]
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            token = value.decode().split(' ')[-1]
+
+    try:
+        poll_id = int(params['id'][0])
+    except (KeyError, ValueError):
+        error = {**ERROR['INPUT'], 'status': 400}
+    else:
+        # subscribe before the result is read, so that no event after it is missed
+        queue = broadcaster.subscribe(poll_id)
+        try:
+            error, info = await sync_to_async(_authorize)(token, poll_id)
+            if error is None:
+                await _stream(info, queue, receive, send)
+                return
+        finally:
+            broadcaster.unsubscribe(poll_id, queue)
+
+    status = error.pop('status')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(error).encode()})
+
+
+async def _stream(info: Dict, queue: asyncio.Queue, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ]})
+    await send({'type': 'http.response.body', 'body': _event('result', info['result']), 'more_body': True})
+
+    disconnect = asyncio.ensure_future(receive())
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait([getter, disconnect], timeout=KEEPALIVE_INTERVAL,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                getter.cancel()
+                return
+            if getter not in done:
+                getter.cancel()
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+
+            event = getter.result()
+            await send({'type': 'http.response.body', 'body': _event(event['event'], event['data']),
+                        'more_body': True})
+            if event['event'] == 'stop' or (event['event'] == 'share' and not event['data']['share']
+                                            and not info['is_host']):
+                break
+    finally:
+        disconnect.cancel()
+
+    await send({'type': 'http.response.body', 'body': b''})
@@ -1,3 +1,151 @@
-from django.test import TestCase
+import json
+import unittest
+import uuid
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from redis import RedisError
+
+from utils import cache
+from utils.cache.connection import client
+
+
+def redis_available() -> bool:
+    try:
+        return client.ping()
+    except RedisError:
+        return False
+
+
+@unittest.skipUnless(redis_available(), 'Redis is not reachable')
+class VoteCounterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.poll = uuid.uuid4().int % 10 ** 12
+        self.addCleanup(client.delete, *cache.poll._keys(self.poll, 1))
+
+    def votes(self):
+        return cache.poll.get_votes(self.poll, 1)
+
+    def test_cast(self):
+        cache.poll.reset_votes(self.poll, 1)
+        self.assertEqual(cache.poll.cast_ballot(self.poll, 1, 7, [1, 2]), (True, None))
+        self.assertEqual(cache.poll.cast_ballot(self.poll, 1, 8, [2]), (True, None))
+        self.assertEqual(self.votes(), ({1: 1, 2: 2}, 2))
+
+        # one ballot per voter
+        self.assertEqual(cache.poll.cast_ballot(self.poll, 1, 7, [3]), (False, [1, 2]))
+        self.assertEqual(self.votes(), ({1: 1, 2: 2}, 2))
+        self.assertEqual(cache.poll.get_ballot(self.poll, 1, 7), [1, 2])
+
+    def test_replace(self):
+        cache.poll.reset_votes(self.poll, 1)
+        cache.poll.cast_ballot(self.poll, 1, 7, [1, 2])
+        self.assertEqual(cache.poll.cast_ballot(self.poll, 1, 7, [2, 3], replace=True), (True, [1, 2]))
+        self.assertEqual(self.votes(), ({1: 0, 2: 1, 3: 1}, 1))
+        self.assertEqual(cache.poll.get_ballot(self.poll, 1, 7), [2, 3])
+
+    def test_withdraw(self):
+        cache.poll.reset_votes(self.poll, 1)
+        cache.poll.cast_ballot(self.poll, 1, 7, [1, 2])
+        cache.poll.cast_ballot(self.poll, 1, 7, [2, 3], replace=True)
+
+        # revert the replacement back to the previous ballot
+        self.assertTrue(cache.poll.withdraw_ballot(self.poll, 1, 7, [2, 3], [1, 2]))
+        self.assertEqual(self.votes(), ({1: 1, 2: 1, 3: 0}, 1))
+        self.assertEqual(cache.poll.get_ballot(self.poll, 1, 7), [1, 2])
+
+        # not the current ballot of the voter any more
+        self.assertFalse(cache.poll.withdraw_ballot(self.poll, 1, 7, [2, 3], [1, 2]))
+
+        self.assertTrue(cache.poll.withdraw_ballot(self.poll, 1, 7, [1, 2], None))
+        self.assertEqual(self.votes(), ({1: 0, 2: 0, 3: 0}, 0))
+        self.assertIsNone(cache.poll.get_ballot(self.poll, 1, 7))
+
+    def test_lost_counters(self):
+        # ballots are still admitted one per voter while the counters are lost
+        self.assertEqual(cache.poll.cast_ballot(self.poll, 1, 7, [1]), (True, None))
+        self.assertEqual(cache.poll.cast_ballot(self.poll, 1, 7, [2]), (False, [1]))
+        self.assertIsNone(self.votes())
+
+    def test_rebuild(self):
+        cache.poll.cast_ballot(self.poll, 1, 7, [1])
+        self.assertTrue(cache.poll.rebuild_votes(self.poll, 1, {1: 3, 2: 1}, [5, 6, 7]))
+        self.assertEqual(self.votes(), ({1: 3, 2: 1}, 3))
+
+        # skipped if the counters are already there
+        self.assertFalse(cache.poll.rebuild_votes(self.poll, 1, {1: 9}, [5]))
+        self.assertEqual(self.votes(), ({1: 3, 2: 1}, 3))
+
+        cache.poll.cast_ballot(self.poll, 1, 8, [2])
+        self.assertEqual(self.votes(), ({1: 3, 2: 2}, 4))
+
+
+@unittest.skipUnless(redis_available(), 'Redis is not reachable')
+class BallotBufferTest(SimpleTestCase):
+    """
+    Run against a Redis for tests, claim takes buffered ballots of all polls
+    """
+
+    def setUp(self):
+        self.poll = uuid.uuid4().int % 10 ** 12
+        self.addCleanup(client.hdel, cache.poll.POLL_PENDING_KEY, self.poll)
+        self.addCleanup(client.delete, f'{cache.poll.POLL_CLOSED_KEY}{self.poll}:1')
+
+    def buffer(self, voter: int, limit: int = 10 ** 6) -> int:
+        return cache.poll.buffer_ballot(self.poll, 1, voter, [[1, 2]], limit)
+
+    def claim(self, visibility_timeout: int = 60):
+        batch, items = cache.poll.claim_ballots(1000, visibility_timeout)
+        return batch, [x['voter'] for x in map(json.loads, items) if x['poll'] == self.poll]
+
+    def test_buffer(self):
+        self.assertEqual(self.buffer(7), 1)
+        self.assertEqual(self.buffer(8), 1)
+        self.assertEqual(cache.poll.pending_ballots(self.poll), 2)
+        self.assertEqual(self.buffer(9, limit=client.llen(cache.poll.POLL_BUFFER_KEY)), 0)
+
+        cache.poll.close_ballots(self.poll, 1)
+        self.assertEqual(self.buffer(9), -1)
+        self.assertEqual(cache.poll.pending_ballots(self.poll), 2)
+
+        batch, voters = self.claim()
+        cache.poll.ack_ballots(batch)
+        self.assertEqual(voters, [7, 8])
+
+    def test_claim(self):
+        self.buffer(7)
+        self.buffer(8)
+        batch, voters = self.claim()
+        self.assertEqual(voters, [7, 8])
+        # still pending until acked
+        self.assertEqual(cache.poll.pending_ballots(self.poll), 2)
+        self.assertEqual(self.claim()[1], [])
+
+        cache.poll.ack_ballots(batch)
+        self.assertEqual(cache.poll.pending_ballots(self.poll), 0)
+        self.assertEqual(self.claim()[1], [])
+
+    def test_redeliver(self):
+        self.buffer(7)
+        batch, voters = self.claim(visibility_timeout=0)
+        self.assertEqual(voters, [7])
+
+        # not acked before the visibility deadline
+        redelivered, voters = self.claim()
+        self.assertEqual(voters, [7])
+        self.assertNotEqual(redelivered, batch)
+
+        # the expired batch is not counted twice
+        cache.poll.ack_ballots(batch)
+        self.assertEqual(cache.poll.pending_ballots(self.poll), 1)
+        cache.poll.ack_ballots(redelivered)
+        self.assertEqual(cache.poll.pending_ballots(self.poll), 0)
+
+    def test_release(self):
+        self.buffer(7)
+        batch, _ = self.claim()
+        cache.poll.release_ballots(batch)
+        redelivered, voters = self.claim()
+        self.assertEqual(voters, [7])
+        cache.poll.ack_ballots(redelivered)
+        self.assertEqual(cache.poll.pending_ballots(self.poll), 0)
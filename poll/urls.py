@@ -1,6 +1,7 @@
 from django.urls import path
 
 from poll.views import *
+from meeting_sample.settings import ASYNC_VIEWS
 
 urlpatterns = [
     path('list/', PollListAPI.as_view()),
@@ -15,3 +16,11 @@ urlpatterns = [
     path('answer/', PollAnswerAPI.as_view()),
     path('share/', ChangeShareStatusAPI.as_view()),
 ]
+
+if ASYNC_VIEWS:
+    # served on the event loop under ASGI, they are matched before the APIViews of the same paths
+    from poll.async_views import poll_commit
+
+    urlpatterns = [
+        path('commit/', poll_commit),
+    ] + urlpatterns
@@ -1,15 +1,23 @@
+import json
 import logging
+import time
+from typing import Dict, List, Optional, Tuple
 
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.db import transaction, IntegrityError
+from django.db.models import Q, Count, QuerySet, Prefetch, F
+from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework.exceptions import ValidationError, APIException, NotFound, PermissionDenied
+from rest_framework.exceptions import ValidationError, APIException, NotFound, PermissionDenied, Throttled
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.relations import PKOnlyObject
 from rest_framework.views import APIView
 from rest_framework_jwt.authentication import JSONWebTokenAuthentication
 
 from meeting.models import Meeting
-from poll.models import PollResult
+from meeting.views import MeetingInfoAPI
+from meeting_sample.settings import POLL_WRITE_BEHIND, POLL_BUFFER_LIMIT, POLL_FLUSH_BATCH
+from poll.models import PollResult, PollBallot, PollRoundResult
 from poll.serializers import *
 from utils import cache
 from utils.errors import ERROR
@@ -19,6 +27,26 @@ from utils.resp import r200
 logger = logging.getLogger(__name__)
 
 
+def is_host(poll: Poll, user: User) -> bool:
+    """
+    Whether the user owns the meeting of the poll, the meeting is read from cached snapshot
+    """
+    try:
+        return MeetingInfoAPI.get_meeting(poll.meeting_id).owner_id == user.id
+    except ObjectDoesNotExist:
+        return False
+
+
+def publish_event(poll_id: int, event: str, data: Dict):
+    """
+    Push an event to the streams of the poll
+    """
+    try:
+        cache.poll.publish_event(poll_id, event, data)
+    except Exception as e:
+        logger.warning(f'failed to publish event {event} of poll {poll_id}: {e}')
+
+
 class PollListAPI(APIView):
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
@@ -38,19 +66,65 @@ class PollListAPI(APIView):
         number = data_in.validated_data['number']
 
         try:
-            polls = Poll.objects.filter(
-                Q(meeting__owner=request.user) | Q(
-                    meeting__status__in=[Poll.Status.ONGOING.value, Poll.Status.DONE.value]),
-                meeting__call_number=number)
+            poll_list = self.poll_list(number)
+        except ObjectDoesNotExist:
+            logger.warning(f'meeting not found: {number}')
+            return r200([])
         except Exception as e:
             logger.error(f'failed to get poll list: {e}')
             err = ERROR['GET_POLL_FAILED']
             err['data'] = str(e)
             raise APIException(err)
 
-        out = PollListOut(instance=polls, many=True)
+        polls = []
+        if poll_list['owner'] == request.user.id or \
+                poll_list['status'] in [Meeting.RoomStatus.ONGOING.value, Meeting.RoomStatus.CLOSING.value,
+                                        Meeting.RoomStatus.CLOSED.value]:
+            polls = poll_list['polls']
+
         logger.info(f'[PollListAPI] success, poll size: {len(polls)}')
-        return r200(out.data)
+        return r200(polls)
+
+    @staticmethod
+    def poll_list(number) -> Dict:
+        """
+        Get all polls of a meeting with owner and status of the meeting, served from cache if possible
+        """
+        version = None
+        try:
+            version, poll_list = cache.poll.get_poll_list(number)
+            if poll_list is not None:
+                return poll_list
+        except Exception as e:
+            logger.warning(f'failed to get poll list of meeting {number} from cache: {e}')
+
+        meeting = MeetingInfoAPI.get_meeting(number)
+        polls = Poll.objects.filter(meeting__call_number=number).annotate(
+            question_count=Count('pollquestion', filter=Q(pollquestion__deleted__isnull=True)))
+        poll_list = {
+            'owner': meeting.owner_id,
+            'status': meeting.status,
+            'polls': PollListOut(instance=polls, many=True).data,
+        }
+
+        if version is None:
+            # the version is unknown, the list may be stale when written back
+            return poll_list
+        try:
+            cache.poll.set_poll_list(number, version, poll_list)
+        except Exception as e:
+            logger.warning(f'failed to cache poll list of meeting {number}: {e}')
+        return poll_list
+
+    @staticmethod
+    def invalidate(number: int):
+        """
+        Drop cached poll list of a meeting, it's called when polls or the meeting changed
+        """
+        try:
+            cache.poll.invalidate_poll_list(number)
+        except Exception as e:
+            logger.error(f'failed to invalidate poll list of meeting {number}: {e}')
 
 
 class PollDetailAPI(APIView):
@@ -73,7 +147,7 @@ class PollDetailAPI(APIView):
         poll_id = data_in.validated_data['id']
 
         try:
-            poll = Poll.objects.get(id=poll_id)
+            definition = self.definition(poll_id)
         except ObjectDoesNotExist:
             logger.error(f'invalid poll ID: {poll_id}')
             err = ERROR['POLL_NOT_FOUND']
@@ -85,18 +159,48 @@ class PollDetailAPI(APIView):
             err['data'] = str(e)
             raise APIException(err)
 
-        tmp = {'title': poll.title, 'questions': [], 'meeting': poll.meeting, 'is_anonymous': poll.is_anonymous}
-        qs = PollQuestion.objects.filter(poll=poll)
-        for question in qs:
-            options = PollOption.objects.filter(question=question)
-            q_tmp = {'id': question.id, 'content': question.content, 'options': [], 'is_single': question.is_single}
-            q_tmp['options'].extend([{'content': x.content, 'id': x.id} for x in options])
-            tmp['questions'].append(q_tmp)
+        meeting = definition['meeting']
+        tmp = {'title': definition['title'], 'questions': definition['questions'],
+               'meeting': PKOnlyObject(pk=meeting) if meeting is not None else None,
+               'is_anonymous': definition['is_anonymous']}
 
         out = PollDetailOut(instance=tmp)
         logger.info('[PollDetailAPI] success: {out.data}')
         return r200(out.data)
 
+    @staticmethod
+    def definition(poll_id: int) -> Dict:
+        """
+        Get definition of a poll: title, questions and options.
+        It's served from cache, and built with one prefetch if not cached.
+        """
+        version = 0
+        try:
+            version, definition = cache.poll.get_definition(poll_id)
+            if definition is not None:
+                return definition
+        except Exception as e:
+            logger.warning(f'failed to get definition of poll {poll_id} from cache: {e}')
+
+        poll = Poll.objects.prefetch_related(
+            Prefetch('pollquestion_set', queryset=PollQuestion.objects.order_by('id').prefetch_related(
+                Prefetch('polloption_set', queryset=PollOption.objects.order_by('id'))))).get(id=poll_id)
+        definition = {
+            'id': poll.id,
+            'meeting': poll.meeting_id,
+            'title': poll.title,
+            'is_anonymous': poll.is_anonymous,
+            'questions': [{'id': q.id, 'content': q.content, 'is_single': q.is_single,
+                           'options': [{'id': o.id, 'content': o.content} for o in q.polloption_set.all()]}
+                          for q in poll.pollquestion_set.all()],
+        }
+
+        try:
+            cache.poll.set_definition(poll_id, version, definition)
+        except Exception as e:
+            logger.warning(f'failed to cache definition of poll {poll_id}: {e}')
+        return definition
+
 
 class PollNewAPI(APIView):
     authentication_classes = (JSONWebTokenAuthentication,)
@@ -119,33 +223,52 @@ class PollNewAPI(APIView):
         questions = data_in.validated_data.pop('questions')
 
         try:
-            meeting = Meeting.objects.get(call_number=number, owner=request.user)
+            meeting = MeetingInfoAPI.get_meeting(number)
+            if meeting.owner_id != request.user.id:
+                raise Meeting.DoesNotExist
         except ObjectDoesNotExist:
             logger.error(f'user has no permission to create poll')
             err = ERROR['POLL_NOT_HOST']
             err['data'] = f'user: {request.user.id} not the owner'
             raise APIException(err)
 
-        poll = None
         try:
-            poll = Poll.objects.create(meeting=meeting, **data_in.validated_data)
-            for q in questions:
-                question, _ = PollQuestion.objects.get_or_create(content=q['content'], poll=poll,
-                                                                 is_single=q['is_single'])
-                for o in q['options']:
-                    PollOption.objects.get_or_create(question=question, content=o['content'])
+            with transaction.atomic():
+                poll = Poll.objects.create(meeting=meeting, **data_in.validated_data)
+                self.create_questions(poll, questions)
         except Exception as e:
             logger.error(f'failed to access database: {e}')
-            if poll:
-                poll.delete()
             err = ERROR['POLL_INFO_DATABASE']
             err['data'] = str(e)
             raise APIException(err)
 
+        PollListAPI.invalidate(meeting.call_number)
         out = PollListOut(instance=poll)
         logger.info(f'[PollNewAPI] create poll success: {poll}')
         return r200(out.data)
 
+    @staticmethod
+    def create_questions(poll: Poll, questions: List[Dict]):
+        """
+        Create questions and options of a poll with bulk insert, in a fixed number of queries.
+        Same questions are merged, and same options of a question too.
+        """
+        merged = {}
+        for q in questions:
+            options = merged.setdefault((q['content'], q['is_single']), [])
+            options.extend([o['content'] for o in q['options'] if o['content'] not in options])
+        if not merged:
+            return
+
+        _qs = PollQuestion.objects.bulk_create(
+            [PollQuestion(poll=poll, content=content, is_single=is_single) for content, is_single in merged])
+        if _qs[0].pk is None:
+            # IDs are not returned by bulk insert of MySQL, read them back in the order of insert
+            _qs = PollQuestion.objects.filter(poll=poll).order_by('id')
+        PollOption.objects.bulk_create(
+            [PollOption(question=question, content=content)
+             for question, options in zip(_qs, merged.values()) for content in options])
+
 
 class PollUpdateAPI(APIView):
     authentication_classes = (JSONWebTokenAuthentication,)
@@ -175,31 +298,39 @@ class PollUpdateAPI(APIView):
             err['data'] = f'invalid poll ID: {poll_id}'
             raise NotFound(err)
 
-        if poll.meeting.owner != request.user:
+        if not is_host(poll, request.user):
             logger.error(f'user has no permission to update poll')
             err = ERROR['POLL_NOT_HOST']
             err['data'] = f'user: {request.user.id} not the owner'
             raise PermissionDenied(err)
 
         try:
-            poll.title = data_in.validated_data['title']
-            poll.is_anonymous = data_in.validated_data['is_anonymous']
-            poll.status = Poll.Status.NEW.value
-            poll.share = Poll.ShareStatus.STOP.value
-            poll.save(update_fields=['title', 'is_anonymous', 'status', 'share'])
-
-            PollQuestion.objects.filter(poll=poll).delete()
-            for q in questions:
-                question, _ = PollQuestion.objects.get_or_create(content=q['content'], poll=poll,
-                                                                 is_single=q['is_single'])
-                for o in q['options']:
-                    PollOption.objects.get_or_create(question=question, content=o['content'])
+            with transaction.atomic():
+                poll.title = data_in.validated_data['title']
+                poll.is_anonymous = data_in.validated_data['is_anonymous']
+                poll.status = Poll.Status.NEW.value
+                poll.share = Poll.ShareStatus.STOP.value
+                poll.ongoing = None
+                poll.save(update_fields=['title', 'is_anonymous', 'status', 'share', 'ongoing'])
+
+                # soft delete in set, safedelete cascades row by row
+                deleted = timezone.now()
+                PollResult.objects.filter(poll=poll).update(deleted=deleted)
+                PollOption.objects.filter(question__poll=poll).update(deleted=deleted)
+                PollQuestion.objects.filter(poll=poll).update(deleted=deleted)
+                PollNewAPI.create_questions(poll, questions)
         except Exception as e:
             logger.error(f'failed to access database: {e}')
             err = ERROR['POLL_INFO_DATABASE']
             err['data'] = str(e)
             raise APIException(err)
 
+        try:
+            cache.poll.invalidate_definition(poll.id)
+        except Exception as e:
+            logger.error(f'failed to invalidate definition of poll {poll.id}: {e}')
+
+        PollListAPI.invalidate(poll.meeting_id)
         logger.info(f'[PollUpdateAPI] success: {poll.id}')
         return r200({'status': 'success'})
 
@@ -242,13 +373,19 @@ class PollDeleteAPI(APIView):
             err['data'] = f'can not delete started or stopped poll: {poll_id}'
             raise ValidationError(err)
 
-        if poll.meeting.owner != request.user:
+        if not is_host(poll, request.user):
             logger.error(f'user has no permission to update poll')
             err = ERROR['POLL_NOT_HOST']
             err['data'] = f'user: {request.user.id} not the owner'
             raise PermissionDenied(err)
 
         poll.delete()
+        try:
+            cache.poll.invalidate_definition(poll_id)
+        except Exception as e:
+            logger.error(f'failed to invalidate definition of poll {poll_id}: {e}')
+
+        PollListAPI.invalidate(poll.meeting_id)
         logger.info(f'[PollDeleteAPI] success: {poll_id}')
         return r200({'status': 'success'})
 
@@ -257,14 +394,14 @@ class PollResultAPI(APIView):
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
-    @swagger_auto_schema(query_serializer=PollIn, tags=['poll'], responses={200: PollResultOut})
+    @swagger_auto_schema(query_serializer=PollResultIn, tags=['poll'], responses={200: PollResultOut})
     def get(self, request, *args, **kwargs):
         """
-        Get poll result summary by ID
+        Get poll result summary by ID, of the current round or a given round
         """
         logger.info(f'[PollResultAPI] user:{request.user.id} get poll result: {request.query_params}')
 
-        data_in = PollIn(data=request.query_params)
+        data_in = PollResultIn(data=request.query_params)
         if not data_in.is_valid():
             logger.error(f'invalid parameter: {data_in.errors}')
             err = ERROR['INPUT']
@@ -274,7 +411,6 @@ class PollResultAPI(APIView):
 
         try:
             poll = Poll.objects.get(id=poll_id)
-            poll_results = PollResult.objects.filter(poll=poll)
         except ObjectDoesNotExist:
             logger.error(f'invalid poll ID: {poll_id}')
             err = ERROR['POLL_NOT_FOUND']
@@ -286,75 +422,177 @@ class PollResultAPI(APIView):
             err['data'] = str(e)
             raise APIException(err)
 
-        if poll.status == Poll.Status.NEW.value:
+        if 'round' not in data_in.validated_data and poll.status == Poll.Status.NEW.value:
             logger.warning(f'poll not start: {poll_id}')
             err = ERROR['POLL_NOT_START']
             err['data'] = f'poll not start: {poll_id}'
             raise ValidationError(err)
 
-        _qs = []
-        data = {
-            'title': poll.title,
-            'is_anonymous': poll.is_anonymous,
-            'status': poll.status,
-            'voter_num': len(set(poll_results.values_list('voter_id', flat=True))),
-            'questions': _qs
-        }
+        _round = data_in.validated_data.get('round', poll.round)
+        if _round < 1 or _round > poll.round:
+            logger.warning(f'invalid round {_round} of poll: {poll_id}')
+            err = ERROR['POLL_NOT_FOUND']
+            err['data'] = f'invalid round {_round} of poll: {poll_id}'
+            raise NotFound(err)
 
         try:
-            questions = PollQuestion.objects.filter(poll_id=poll_id)
-            options = PollOption.objects.filter(question__in=questions)
+            data = self.result(poll, _round)
         except Exception as e:
-            logger.error(f'failed to get questions and options: {e}')
+            logger.error(f'failed to summarize poll result: {e}')
             err = ERROR['POLL_INFO_DATABASE']
-            err['data'] = f'failed to get questions and options: {e}'
+            err['data'] = f'failed to summarize poll result: {e}'
             raise APIException(err)
 
-        _tmp = {}
-        for o in options:
-            if _tmp.get(o.question.content, None) is None:
-                _tmp[o.question.content] = {}
-            if _tmp[o.question.content].get(o.content, None) is None:
-                _tmp[o.question.content][o.content] = {'count': 0, 'voters': None}
-            _tmp[o.question.content]['is_single'] = o.question.is_single
-
-        _round = poll.round
-        _is_anonymous = poll.is_anonymous
-        for r in poll_results:
-            if r.round != _round:
-                continue
-            _tmp[r.question.content][r.option.content]['count'] = _tmp[r.question.content][r.option.content].get(
-                'count', 0) + 1
-            if not _is_anonymous:
-                if _tmp[r.question.content][r.option.content].get('voters', None) is None:
-                    _tmp[r.question.content][r.option.content]['voters'] = []
-                _tmp[r.question.content][r.option.content]['voters'].append(r.voter)
-        for q_t, q_o in _tmp.items():
-            answers = []
-            is_single = q_o.pop('is_single')
-            for o_c, o_a in q_o.items():
-                _v = {'content': o_c}
-                _v.update(o_a)
-                answers.append(_v)
-            _qs.append({'content': q_t, 'is_single': is_single, 'options': answers})
-
         out = PollResultOut(instance=data)
         logger.info(f'[PollResultAPI] success: {out.data}')
         return r200(out.data)
 
+    @staticmethod
+    def result(poll: Poll, _round: int) -> Dict:
+        """
+        Result of the ongoing round is summarized from live counters, others from frozen snapshots
+        """
+        if _round == poll.round and poll.status == Poll.Status.ONGOING.value:
+            counts, voter_num = PollResultAPI.live_votes(poll)
+            return PollResultAPI.summarize(poll, counts, voter_num)
+        return PollResultAPI.frozen_result(poll, _round)
+
+    @staticmethod
+    def live_votes(poll: Poll) -> Tuple[Dict[int, int], int]:
+        """
+        Get vote counters of current round from cache, rebuild them from database if lost
+        """
+        try:
+            votes = cache.poll.get_votes(poll.id, poll.round)
+        except Exception as e:
+            logger.warning(f'failed to get vote counters of poll {poll.id}: {e}')
+            votes = None
+        if votes is not None:
+            return votes
+
+        results = PollResult.objects.filter(poll=poll, round=poll.round)
+        counts = {x['option_id']: x['count'] for x in
+                  results.values('option_id').annotate(count=Count('id')).order_by()}
+        voters = list(results.values_list('voter_id', flat=True).distinct())
+        try:
+            cache.poll.rebuild_votes(poll.id, poll.round, counts, voters)
+            logger.info(f'rebuild vote counters of poll {poll.id} round {poll.round}')
+        except Exception as e:
+            logger.warning(f'failed to rebuild vote counters of poll {poll.id}: {e}')
+        return counts, len(voters)
+
+    @staticmethod
+    def frozen_result(poll: Poll, _round: int) -> Dict:
+        """
+        Get the result of a stopped round from its snapshot, freeze it first if not yet
+        """
+        result = PollRoundResult.objects.filter(poll=poll, round=_round).values_list('result', flat=True).first()
+        if result is not None:
+            return result
+        stopped = PollResultAPI.stopped(poll, _round)
+        if stopped and PollResultAPI.persisted(poll):
+            return PollResultAPI.freeze(poll, _round)
+
+        # the round is reset before stopped, or some ballots are still buffered,
+        # serve the result without freezing it
+        if _round == poll.round:
+            counts, voter_num = PollResultAPI.live_votes(poll)
+            result = PollResultAPI.summarize(poll, counts, voter_num)
+        else:
+            result = PollResultAPI.summarize(poll, _round=_round)
+        if stopped:
+            result['status'] = Poll.Status.DONE.value
+        return result
+
+    @staticmethod
+    def stopped(poll: Poll, _round: int) -> bool:
+        """
+        Whether stopping the round is completed, a round replaced by the next one has been stopped
+        """
+        return _round < poll.round or (_round == poll.round and poll.status == Poll.Status.DONE.value)
+
+    @staticmethod
+    def persisted(poll: Poll) -> bool:
+        """
+        Whether all accepted ballots of the poll are persisted, the result must not be frozen before it
+        """
+        if not POLL_WRITE_BEHIND:
+            return True
+        try:
+            return cache.poll.pending_ballots(poll.id) <= 0
+        except Exception as e:
+            logger.warning(f'failed to get pending ballots of poll {poll.id}: {e}')
+            return False
+
+    @staticmethod
+    def freeze(poll: Poll, _round: int) -> Dict:
+        """
+        Save the final result of a stopped round as an immutable snapshot, refuse it while ballots are buffered
+        """
+        if not PollResultAPI.stopped(poll, _round):
+            raise RuntimeError(f'round {_round} of poll {poll.id} is not stopped yet')
+        if not PollResultAPI.persisted(poll):
+            raise RuntimeError(f'ballots of poll {poll.id} are not persisted yet')
+        result = PollResultAPI.summarize(poll, _round=_round)
+        result['status'] = Poll.Status.DONE.value
+        try:
+            PollRoundResult.objects.create(poll=poll, round=_round, result=result)
+        except IntegrityError:
+            logger.info(f'result of poll {poll.id} round {_round} is already frozen')
+        return result
+
+    @staticmethod
+    def summarize(poll: Poll, counts: Optional[Dict[int, int]] = None, voter_num: Optional[int] = None,
+                  _round: Optional[int] = None) -> Dict:
+        """
+        Summarize a round of a poll, the current round by default.
+        Votes are counted by database with GROUP BY option unless counts and voter_num are given,
+        so the number of queries does not depend on the number of voters.
+        """
+        results = PollResult.objects.filter(poll=poll, round=poll.round if _round is None else _round)
+        questions = PollQuestion.objects.filter(poll=poll).order_by('id')
+        options = PollOption.objects.filter(question__in=questions).order_by('id')
+
+        if counts is None:
+            counts = {x['option_id']: x['count'] for x in
+                      results.values('option_id').annotate(count=Count('id')).order_by()}
+        if voter_num is None:
+            voter_num = results.values('voter_id').distinct().count()
+
+        voters = {}
+        if not poll.is_anonymous:
+            for option_id, voter_id, username in results.values_list('option_id', 'voter_id', 'voter__username'):
+                voters.setdefault(option_id, []).append({'id': voter_id, 'username': username})
+
+        _qs = {q.id: {'content': q.content, 'is_single': q.is_single, 'options': []} for q in questions}
+        for o in options:
+            _qs[o.question_id]['options'].append({
+                'content': o.content,
+                'count': counts.get(o.id, 0),
+                'voters': voters.get(o.id, None),
+            })
+
+        return {
+            'title': poll.title,
+            'is_anonymous': poll.is_anonymous,
+            'status': poll.status,
+            'voter_num': voter_num,
+            'questions': list(_qs.values()),
+        }
+
 
 class PollStartAPI(APIView):
     authentication_classes = (JSONWebTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
-    @swagger_auto_schema(request_body=PollIn, tags=['poll'], responses={200: PollStartOut})
+    @swagger_auto_schema(request_body=PollStartIn, tags=['poll'], responses={200: PollStartOut})
     def post(self, request, *args, **kwargs):
         """
         Start or re start a poll by poll ID
         """
         logger.info(f'[PollStartAPI] user:{request.user.id} start poll: {request.data}')
 
-        data_in = PollIn(data=request.data)
+        data_in = PollStartIn(data=request.data)
         if not data_in.is_valid():
             logger.error(f'invalid parameter: {data_in.errors}')
             err = ERROR['INPUT']
@@ -375,60 +613,47 @@ class PollStartAPI(APIView):
             err['data'] = str(e)
             raise APIException(err)
 
-        lock_name = f'new-pull-lock-{poll.meeting.call_number}'
-        _lock = None
+        # One meeting only start a poll, guarded by the unique constraint on (meeting, ongoing)
         try:
-            _lock = cache.acquire_lock_with_timeout(
-                lock_name, poll.meeting.call_number, acquire_timeout=10, lock_timeout=10)
+            started = Poll.objects.filter(id=poll.id).exclude(status=Poll.Status.ONGOING.value).update(
+                status=Poll.Status.ONGOING.value,
+                share=Poll.ShareStatus.STOP.value,
+                round=F('round') + 1,
+                ongoing=True
+            )
+        except IntegrityError:
+            logger.warning(f'already start other poll in meeting {poll.meeting_id}')
+            err = ERROR['POLL_EXIST']
+            err['data'] = f'already start other poll in meeting {poll.meeting_id}'
+            raise ValidationError(err)
         except Exception as e:
-            logger.error(f'failed to lock room: {e}')
-            err = ERROR['INTERNAL']
+            logger.error(f'failed to start poll: {e}')
+            err = ERROR['POLL_INFO_DATABASE']
             err['data'] = str(e)
             raise APIException(err)
 
-        if _lock is None:
-            err = ERROR['POLL_ALREADY_START']
-            err['data'] = f'poll already start: {poll_id}'
-            raise APIException(err)
-
-        if poll.status == Poll.Status.ONGOING.value:
+        if not started:
             logger.warning(f'poll already start: {poll_id}')
             err = ERROR['POLL_ALREADY_START']
             err['data'] = f'poll already start: {poll_id}'
-            cache.release_lock(lock_name, _lock)
-            raise APIException(err)
-
-        try:
-            polls = Poll.objects.filter(meeting=poll.meeting)
-        except Exception as e:
-            logger.error(f'failed to access database: {e}')
-            err = ERROR['POLL_INFO_DATABASE']
-            err['data'] = str(e)
-            cache.release_lock(lock_name, _lock)
             raise APIException(err)
 
-        # One meeting only start a poll
-        for _poll in polls:
-            if _poll.status == Poll.Status.ONGOING.value:
-                logger.warning(f'already start poll {_poll.id} in meeting {_poll.meeting.call_number}')
-                err = ERROR['POLL_EXIST']
-                err['data'] = f'already start poll {_poll.id} in meeting {_poll.meeting.call_number}'
-                cache.release_lock(lock_name, _lock)
-                raise ValidationError(err)
+        poll.status = Poll.Status.ONGOING.value
+        poll.share = Poll.ShareStatus.STOP.value
+        poll.round += 1
+        poll.ongoing = True
 
         try:
-            Poll.objects.filter(id=poll.id).update(
-                status=Poll.Status.ONGOING.value,
-                share=Poll.ShareStatus.STOP.value,
-                round=poll.round + 1
-            )
+            cache.poll.reset_votes(poll.id, poll.round)
         except Exception as e:
-            logger.error(f'failed to get poll list: {e}')
-            err = ERROR['GET_POLL_FAILED']
-            err['data'] = str(e)
-        finally:
-            cache.release_lock(lock_name, _lock)
+            logger.warning(f'failed to reset vote counters of poll {poll.id}: {e}')
+
+        if 'duration' in data_in.validated_data:
+            cache.delay_queue.schedule_after(cache.delay_queue.POLL_STOP, poll.id, data_in.validated_data['duration'],
+                                             {'round': poll.round})
 
+        PollListAPI.invalidate(poll.meeting_id)
+        publish_event(poll.id, 'start', {'round': poll.round})
         out = PollStartOut(instance=poll)
         logger.info(f'[PollStartAPI] success: {out.data}')
         return r200(out.data)
@@ -466,18 +691,62 @@ class PollStopAPI(APIView):
             err['data'] = str(e)
             raise APIException(err)
 
-        if poll.meeting.owner != request.user:
+        if not is_host(poll, request.user):
             logger.error(f'user has no permission to stop poll')
             err = ERROR['POLL_NOT_HOST']
             err['data'] = f'user: {request.user.id} not the owner'
             raise PermissionDenied(err)
 
-        poll.status = Poll.Status.DONE.value
-        poll.save(update_fields=['status'])
+        if not self.stop_poll(poll):
+            logger.error(f'failed to persist all ballots of poll: {poll.id}')
+            err = ERROR['POLL_BUSY']
+            err['data'] = f'ballots of poll {poll.id} are not persisted yet'
+            raise APIException(err)
+
+        cache.delay_queue.cancel(cache.delay_queue.POLL_STOP, poll.id)
         out = PollStartOut(instance=poll)
         logger.info(f'[PollStopAPI] success: {out.data}')
         return r200(out.data)
 
+    @staticmethod
+    def stop_poll(poll: Poll) -> bool:
+        """
+        Stop the ongoing poll and freeze its result, it's called by host or the delay task.
+        Return False if the ballots are not persisted in time, the poll is left ongoing but closed to new ballots,
+        so that stopping it again completes the work.
+        """
+        if POLL_WRITE_BEHIND:
+            cache.poll.close_ballots(poll.id, poll.round)
+            if not PollStopAPI.drain(poll.id):
+                return False
+
+        poll.status = Poll.Status.DONE.value
+        poll.ongoing = None
+        poll.save(update_fields=['status', 'ongoing'])
+
+        result = None
+        try:
+            result = PollResultAPI.freeze(poll, poll.round)
+        except Exception as e:
+            # it will be frozen when the result is read
+            logger.error(f'failed to freeze result of poll {poll.id} round {poll.round}: {e}')
+        publish_event(poll.id, 'stop', {'round': poll.round, 'result': result})
+
+        PollListAPI.invalidate(poll.meeting_id)
+        return True
+
+    @staticmethod
+    def drain(poll_id: int, timeout: float = 10) -> bool:
+        """
+        Wait until all accepted ballots of the poll are persisted by the flush worker
+        """
+        end = time.time() + timeout
+        while time.time() < end:
+            if cache.poll.pending_ballots(poll_id) <= 0:
+                return True
+            time.sleep(0.05)
+        return False
+
 
 class PollCommitAPI(APIView):
     authentication_classes = (JSONWebTokenAuthentication,)
@@ -490,14 +759,56 @@ class PollCommitAPI(APIView):
         """
         logger.info(f'[PollCommitAPI] user:{request.user.id} commit poll: {request.data}')
 
-        data_in = PollCommitIn(data=request.data)
+        poll_id, replace, options = self.validate(request.data)
+        poll = self.get_poll(poll_id)
+        voter = request.user.id
+        option_ids = [o_id for _, o_id in options]
+
+        # admit one ballot per voter in cache, the unique constraint of database is the backstop
+        admitted, old = None, None
+        try:
+            admitted, old = cache.poll.cast_ballot(poll_id, poll.round, voter, option_ids, replace)
+        except Exception as e:
+            logger.warning(f'failed to admit ballot of poll {poll_id} in cache: {e}')
+        self.check_admitted(poll, voter, admitted)
+
+        try:
+            self.save_ballot(poll, voter, options, replace)
+        except Exception:
+            if admitted:
+                try:
+                    cache.poll.withdraw_ballot(poll_id, poll.round, voter, option_ids, old)
+                except Exception as e:
+                    logger.warning(f'failed to withdraw ballot of poll {poll_id} in cache: {e}')
+            raise
+
+        publish_event(poll_id, 'vote', self.vote_event(poll, option_ids, old))
+
+        out = PollCommitOut(instance={'poll_id': poll_id, 'round': poll.round})
+        logger.info(f'[PollCommitAPI] success: {out.data}')
+        return r200(out.data)
+
+    # The steps below are shared with the async view, which only does the cache I/O on the event loop
+
+    @staticmethod
+    def validate(data: Dict) -> Tuple[int, bool, List[Tuple[int, int]]]:
+        """
+        Return (poll ID, replace, list of (question ID, option ID)) of the ballot
+        """
+        data_in = PollCommitIn(data=data)
         if not data_in.is_valid():
             logger.error(f'invalid parameter: {data_in.errors}')
             err = ERROR['INPUT']
             err['data'] = data_in.errors
             raise ValidationError(err)
-        poll_id = data_in.validated_data['poll_id']
+        options = [(q['id'], o['id']) for q in data_in.validated_data['questions'] for o in q['options']]
+        return data_in.validated_data['poll_id'], data_in.validated_data['replace'], options
 
+    @staticmethod
+    def get_poll(poll_id: int) -> Poll:
+        """
+        Get the poll accepting ballots
+        """
         try:
             poll = Poll.objects.get(id=poll_id)
         except ObjectDoesNotExist:
@@ -505,27 +816,164 @@ class PollCommitAPI(APIView):
             err = ERROR['POLL_NOT_FOUND']
             err['data'] = f'not fount ongoing poll ID: {poll_id}'
             raise NotFound(err)
+        PollCommitAPI.check_ongoing(poll)
+        return poll
+
+    @staticmethod
+    def check_admitted(poll: Poll, voter: int, admitted: Optional[bool]):
+        """
+        Raise the error if the cache refused the ballot, None means the cache is not available
+        """
+        if admitted is False:
+            logger.warning(f'user {voter} already voted in poll {poll.id} round {poll.round}')
+            err = ERROR['POLL_ALREADY_VOTED']
+            err['data'] = f'already voted in poll {poll.id} round {poll.round}'
+            raise ValidationError(err)
+
+    @staticmethod
+    def check_ongoing(poll: Poll):
+        """
+        Raise the error if the poll is not accepting ballots
+        """
         if poll.status == Poll.Status.DONE.value:
-            logger.warning(f'poll is over: {poll_id}')
+            logger.warning(f'poll is over: {poll.id}')
             err = ERROR['POLL_ALREADY_DONE']
-            err['data'] = f'poll is over: {poll_id}'
+            err['data'] = f'poll is over: {poll.id}'
             raise ValidationError(err)
 
         if poll.status == Poll.Status.NEW.value:
-            logger.warning(f'poll not start: {poll_id}')
+            logger.warning(f'poll not start: {poll.id}')
             err = ERROR['POLL_NOT_START']
-            err['data'] = f'poll not start: {poll_id}'
+            err['data'] = f'poll not start: {poll.id}'
             raise APIException(err)
 
-        for q in data_in.validated_data['questions']:
-            for o_id in q['options']:
-                PollResult.objects.create(poll_id=poll_id, question_id=q['id'], option_id=o_id['id'],
-                                          voter=request.user, round=poll.round)
+    @staticmethod
+    def vote_event(poll: Poll, option_ids: List[int], old: Optional[List[int]]) -> Dict:
+        """
+        Changes of the counters by a ballot, old is the options of the ballot replaced
+        """
+        votes = {o_id: 1 for o_id in option_ids}
+        for o_id in old or []:
+            votes[o_id] = votes.get(o_id, 0) - 1
+        return {'round': poll.round, 'votes': votes, 'voters': 0 if old is not None else 1}
 
-        data = {'poll_id': poll_id, 'round': poll.round}
-        out = PollCommitOut(instance=data)
-        logger.info(f'[PollCommitAPI] success: {out.data}')
-        return r200(out.data)
+    @staticmethod
+    def save_ballot(poll: Poll, voter: int, options: List[Tuple[int, int]], replace: bool):
+        """
+        Buffer the ballot in write-behind mode, otherwise save it to database in one transaction
+        """
+        if POLL_WRITE_BEHIND:
+            try:
+                buffered = cache.poll.buffer_ballot(poll.id, poll.round, voter, options, POLL_BUFFER_LIMIT, replace)
+            except Exception as e:
+                logger.warning(f'failed to buffer ballot, write it to database: {e}')
+            else:
+                PollCommitAPI.check_buffered(poll, buffered)
+                return
+
+        PollCommitAPI.write_ballot(poll, voter, options, replace)
+
+    @staticmethod
+    def check_buffered(poll: Poll, buffered: int):
+        """
+        Raise the error if the ballot is not accepted by the write-behind buffer
+        """
+        if buffered < 0:
+            logger.warning(f'poll is being stopped: {poll.id}')
+            err = ERROR['POLL_ALREADY_DONE']
+            err['data'] = f'poll is over: {poll.id}'
+            raise ValidationError(err)
+
+        if buffered == 0:
+            logger.warning(f'ballot buffer is full, reject commit of poll: {poll.id}')
+            err = ERROR['POLL_BUSY']
+            err['data'] = f'ballot buffer is full, poll: {poll.id}'
+            raise Throttled(wait=1, detail=err)
+
+    @staticmethod
+    def write_ballot(poll: Poll, voter: int, options: List[Tuple[int, int]], replace: bool):
+        """
+        Save the ballot to database. The poll row is locked while the round is checked ongoing,
+        so stopping the round waits for the commit, and the result frozen after it contains the ballot.
+        """
+        try:
+            with transaction.atomic():
+                ongoing = Poll.objects.select_for_update(). \
+                    filter(id=poll.id, status=Poll.Status.ONGOING.value, round=poll.round). \
+                    values_list('id', flat=True).first() is not None
+                if ongoing:
+                    if replace:
+                        PollBallot.objects.bulk_create([PollBallot(poll=poll, round=poll.round, voter_id=voter)],
+                                                       ignore_conflicts=True)
+                        # one set-based hard delete, so that the new votes will not hit the unique constraint
+                        QuerySet.delete(PollResult.objects.filter(poll=poll, round=poll.round, voter_id=voter))
+                    else:
+                        PollBallot.objects.create(poll=poll, round=poll.round, voter_id=voter)
+                    PollResult.objects.bulk_create(
+                        [PollResult(poll=poll, question_id=q_id, option_id=o_id, voter_id=voter, round=poll.round)
+                         for q_id, o_id in options])
+        except IntegrityError:
+            logger.warning(f'user {voter} already voted in poll {poll.id} round {poll.round}')
+            err = ERROR['POLL_ALREADY_VOTED']
+            err['data'] = f'already voted in poll {poll.id} round {poll.round}'
+            raise ValidationError(err)
+        except Exception as e:
+            logger.error(f'failed to save poll result: {e}')
+            err = ERROR['POLL_INFO_DATABASE']
+            err['data'] = str(e)
+            raise APIException(err)
+
+        if not ongoing:
+            logger.warning(f'poll is over: {poll.id} round {poll.round}')
+            err = ERROR['POLL_ALREADY_DONE']
+            err['data'] = f'poll is over: {poll.id}'
+            raise ValidationError(err)
+
+    @staticmethod
+    def flush_ballots(items: List[bytes]):
+        """
+        Persist ballots claimed from the write-behind buffer with bulk operations.
+        A ballot may be delivered more than once, duplicated votes are dropped by the unique constraint.
+        """
+        ballots = {}
+        replaced = Q()
+        for item in items:
+            ballot = json.loads(item)
+            key = (ballot['poll'], ballot['round'], ballot['voter'])
+            # only the last ballot of a voter in the batch counts
+            ballots[key] = ballot
+            if ballot.get('replace', False):
+                replaced |= Q(poll_id=key[0], round=key[1], voter_id=key[2])
+
+        results = []
+        for (poll_id, _round, voter), ballot in ballots.items():
+            results.extend([PollResult(poll_id=poll_id, question_id=q_id, option_id=o_id, voter_id=voter, round=_round)
+                            for q_id, o_id in ballot['options']])
+
+        with transaction.atomic():
+            if replaced:
+                QuerySet.delete(PollResult.objects.filter(replaced))
+            PollBallot.objects.bulk_create([PollBallot(poll_id=k[0], round=k[1], voter_id=k[2]) for k in ballots],
+                                           batch_size=POLL_FLUSH_BATCH, ignore_conflicts=True)
+            PollResult.objects.bulk_create(results, batch_size=POLL_FLUSH_BATCH, ignore_conflicts=True)
+        logger.info(f'flush ballots: {len(items)}, votes: {len(results)}')
+
+    @staticmethod
+    def flush_batch(visibility_timeout: int = 60) -> int:
+        """
+        Claim a batch of ballots from the write-behind buffer and persist it, return number of the ballots.
+        A failed batch is put back to the buffer at once, a batch of crashed worker after visibility_timeout.
+        """
+        batch, items = cache.poll.claim_ballots(POLL_FLUSH_BATCH, visibility_timeout)
+        if not items:
+            return 0
+        try:
+            PollCommitAPI.flush_ballots(items)
+        except Exception:
+            cache.poll.release_ballots(batch)
+            raise
+        cache.poll.ack_ballots(batch)
+        return len(items)
 
 
 class PollAnswerAPI(APIView):
@@ -548,22 +996,34 @@ class PollAnswerAPI(APIView):
         poll_id = data_in.validated_data['id']
 
         try:
-            poll = Poll.objects.get(id=poll_id)
-            poll_results = PollResult.objects.filter(poll_id=poll_id, voter=request.user,
-                                                     round=poll.round)
+            definition = PollDetailAPI.definition(poll_id)
+            _round = Poll.objects.values_list('round', flat=True).get(id=poll_id)
+        except ObjectDoesNotExist:
+            logger.error(f'invalid poll ID: {poll_id}')
+            err = ERROR['POLL_NOT_FOUND']
+            err['data'] = f'invalid poll ID: {poll_id}'
+            raise NotFound(err)
         except Exception as e:
             logger.error(f'failed to access database: {e}')
             err = ERROR['POLL_INFO_DATABASE']
             err['data'] = str(e)
             raise APIException(err)
 
-        user_options = [x.option.id for x in poll_results]
-        tmp = {'title': poll.title, 'questions': []}
-        qs = PollQuestion.objects.filter(poll=poll)
-        for question in qs:
-            options = PollOption.objects.filter(question=question)
-            q_tmp = {'content': question.content, 'options': [], 'is_single': question.is_single}
-            q_tmp['options'].extend([{'content': x.content, 'select': x.id in user_options} for x in options])
+        user_options = None
+        try:
+            user_options = cache.poll.get_ballot(poll_id, _round, request.user.id)
+        except Exception as e:
+            logger.warning(f'failed to get ballot of poll {poll_id} from cache: {e}')
+        if user_options is None:
+            user_options = PollResult.objects.filter(poll_id=poll_id, voter=request.user, round=_round). \
+                values_list('option_id', flat=True)
+        user_options = set(user_options)
+
+        tmp = {'title': definition['title'], 'questions': []}
+        for question in definition['questions']:
+            q_tmp = {'content': question['content'], 'options': [], 'is_single': question['is_single']}
+            q_tmp['options'].extend([{'content': x['content'], 'select': x['id'] in user_options}
+                                     for x in question['options']])
             tmp['questions'].append(q_tmp)
 
         out = PollAnswerOut(instance=tmp)
@@ -612,6 +1072,8 @@ class ChangeShareStatusAPI(APIView):
             err['data'] = str(e)
             raise APIException(err)
 
+        PollListAPI.invalidate(poll.meeting_id)
+        publish_event(poll.id, 'share', {'share': poll.share})
         out = PollListOut(instance=poll)
         logger.info(f'[ChangeShareStatusAPI] success: {out.data}')
         return r200(out.data)
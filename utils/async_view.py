@@ -0,0 +1,85 @@
+"""
+Async function views served like the APIViews: JWT authentication, camel case JSON and the same error responses.
+Django 3.2 and DRF run APIViews in a thread, these views run on the event loop of ASGI.
+"""
+import functools
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import JsonResponse
+from djangorestframework_camel_case.util import camelize, underscoreize
+from rest_framework.exceptions import MethodNotAllowed, NotAuthenticated, ParseError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+
+from utils.resp import custom_exception_handler
+
+logger = logging.getLogger(__name__)
+
+_authentication = JSONWebTokenAuthentication()
+
+
+def db_sync_to_async(func):
+    """
+    Run ORM calls in the thread pool, not bound to one thread as sync views,
+    and close the connections out of date like a request does.
+    """
+
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+def _render(response: Response) -> JsonResponse:
+    out = JsonResponse(camelize(response.data), encoder=JSONEncoder, status=response.status_code, safe=False)
+    for name, value in response.items():
+        if name.lower() != 'content-type':
+            out[name] = value
+    return out
+
+
+def async_api(methods=('POST',)):
+    """
+    Decorate an async view, it reads request.user and request.data as an APIView and returns r200(...)
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def view(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise MethodNotAllowed(request.method)
+
+                user_auth = await db_sync_to_async(_authentication.authenticate)(request)
+                if user_auth is None:
+                    raise NotAuthenticated()
+                request.user = user_auth[0]
+
+                if request.method == 'GET':
+                    request.data = underscoreize(request.GET.dict())
+                else:
+                    try:
+                        request.data = underscoreize(json.loads(request.body or b'{}'))
+                    except ValueError as e:
+                        raise ParseError(f'JSON parse error - {e}')
+
+                response = await func(request, *args, **kwargs)
+            except Exception as e:
+                response = custom_exception_handler(e, {'request': request})
+                if response.status_code >= 500:
+                    logger.exception(f'failed to serve {request.path}: {e}')
+            return _render(response)
+
+        # CSRF is not applied to APIViews either
+        view.csrf_exempt = True
+        return view
+
+    return decorator
@@ -1,5 +1,6 @@
 from . import group
+from . import poll
 from . import share_user
-from .connection import acquire_lock_with_timeout, release_lock
+from .connection import acquire_lock_with_timeout, release_lock, extend_lock, lock_metrics
 from .delay_queue import *
 from .meeting import *
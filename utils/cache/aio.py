@@ -0,0 +1,109 @@
+"""
+Asyncio client of Redis for the async views, it runs the same scripts on the same keys as the sync client.
+Keys, arguments and results are built and parsed by the sync modules, only the I/O is here.
+aioredis doesn't support cluster, ASYNC_VIEWS is off on cluster so that the APIViews are routed instead.
+"""
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import aioredis
+
+from meeting_sample.settings import REDIS_HOST, REDIS_CLUSTER_ENABLED, ASYNC_REDIS_POOL_SIZE, ASYNC_SHARE_WAITERS
+from utils.cache import delay_queue, group, meeting, poll
+
+logger = logging.getLogger(__name__)
+
+if REDIS_CLUSTER_ENABLED:
+    raise RuntimeError('async views need a single Redis server')
+
+# a request waits for a free connection instead of failing when the pool is used up
+pool = aioredis.BlockingConnectionPool.from_url(REDIS_HOST, max_connections=ASYNC_REDIS_POOL_SIZE, timeout=5)
+client = aioredis.Redis(connection_pool=pool)
+
+# a waiter of the share lease blocks its connection, waiters have a pool of their own
+# so that they never use up the connections of other requests
+_waiter_pool = aioredis.BlockingConnectionPool.from_url(REDIS_HOST, max_connections=ASYNC_SHARE_WAITERS, timeout=1)
+_waiter = aioredis.Redis(connection_pool=_waiter_pool)
+
+_lookup_script = client.register_script(meeting._lookup_script.script)
+_acquire_share_script = client.register_script(meeting._acquire_share_script.script)
+_release_share_script = client.register_script(meeting._release_share_script.script)
+_cast_script = client.register_script(poll._cast_script.script)
+_withdraw_script = client.register_script(poll._withdraw_script.script)
+_buffer_script = client.register_script(poll._buffer_script.script)
+_push_script = client.register_script(delay_queue._push_script.script)
+_cancel_script = client.register_script(delay_queue._cancel_script.script)
+
+
+async def get_meeting_snapshot(meeting_id: int) -> Tuple[int, bool, Optional[Dict]]:
+    return meeting._parse_snapshot(*await client.mget(meeting._snapshot_keys(meeting_id)))
+
+
+async def lookup_meeting(meeting_id: int) -> Tuple[int, Optional[List[Dict]]]:
+    return meeting._parse_lookup(await _lookup_script(keys=meeting._meeting_keys(meeting_id)))
+
+
+async def get_sharing_user(meeting_id: int) -> int:
+    pipe = client.pipeline()
+    pipe.exists(meeting._meeting_key(meeting_id))
+    pipe.get(meeting._share_keys(meeting_id)[0])
+    return meeting._parse_sharing_user(*await pipe.execute())
+
+
+async def acquire_share(meeting_id: int, user_id: int, lease: int) -> Tuple[int, int]:
+    holder, ttl = await _acquire_share_script(keys=meeting._acquire_share_keys(meeting_id), args=[user_id, lease])
+    return int(holder), int(ttl)
+
+
+async def release_share(meeting_id: int, user_id: int) -> bool:
+    return bool(await _release_share_script(keys=meeting._share_keys(meeting_id), args=[user_id]))
+
+
+async def wait_share(meeting_id: int, timeout: float) -> bool:
+    """
+    Wait for the lease to be released without holding a thread, on a connection of the waiter pool.
+    Return False after waiting for a free connection 1 second if the waiter pool is used up.
+    """
+    try:
+        return await _waiter.blpop([meeting._share_keys(meeting_id)[1]], timeout=max(1, int(timeout))) is not None
+    except aioredis.ConnectionError as e:
+        logger.warning(f'failed to wait for share lease of meeting {meeting_id}: {e}')
+        return False
+
+
+async def get_group_info(meeting_id: int) -> Optional[Dict]:
+    val = await client.get(group._key(meeting_id))
+    if val is None:
+        return None
+    return json.loads(val)
+
+
+async def cast_ballot(poll_id: int, _round: int, voter: int, options: List[int],
+                      replace: bool = False) -> Tuple[bool, Optional[List[int]]]:
+    args = poll._cast_args(voter, options, replace)
+    return poll._parse_cast(await _cast_script(keys=poll._keys(poll_id, _round), args=args))
+
+
+async def withdraw_ballot(poll_id: int, _round: int, voter: int, options: List[int], old: Optional[List[int]]) -> bool:
+    args = poll._withdraw_args(voter, options, old)
+    return bool(await _withdraw_script(keys=poll._keys(poll_id, _round), args=args))
+
+
+async def buffer_ballot(poll_id: int, _round: int, voter: int, options: List[Tuple[int, int]], limit: int,
+                        replace: bool = False) -> int:
+    keys, args = poll._buffer_params(poll_id, _round, voter, options, limit, replace)
+    return int(await _buffer_script(keys=keys, args=args))
+
+
+async def publish_event(poll_id: int, event: str, data: Dict) -> int:
+    return await client.publish(poll.POLL_EVENT_CHANNEL, poll._event_message(poll_id, event, data))
+
+
+async def schedule_after(kind: str, key, seconds: float, payload: Optional[Dict] = None) -> bool:
+    args = delay_queue._push_args(kind, key, delay_queue._now() + int(seconds), payload)
+    return bool(await _push_script(keys=delay_queue._keys(), args=args))
+
+
+async def cancel(kind: str, key) -> None:
+    await _cancel_script(keys=delay_queue._keys(), args=delay_queue._cancel_args(kind, key))
@@ -1,7 +1,10 @@
 import logging
 import os
+import random
+import threading
 import time
-from typing import Optional
+import uuid
+from typing import Dict, List, NamedTuple, Optional
 
 import redis
 from rediscluster import RedisCluster
@@ -11,6 +14,8 @@ from meeting_sample.settings import REDIS_HOST, REDIS_CLUSTER_ENABLED, REDIS_PRE
 logger = logging.getLogger(__name__)
 
 DEFAULT_EXPIRE_TIME = os.getenv('CACHE_EXPIRE', 8 * 60 * 60)  # 8 hours
+# Global keys changed by one script share the hash tag, such as the delay queue
+HASH_TAG = f'{{{REDIS_PREFIX}}}'
 VALID_SHADOW_USER_KEY = f'{REDIS_PREFIX}:valid_shadow_user'
 
 if REDIS_HOST is None:
@@ -31,6 +36,31 @@ else:
     logger.info(f'Connect to Redis single server: {REDIS_HOST}')
 
 
+_set_if_version_script = client.register_script("""
+    if tonumber(redis.call('get', KEYS[2]) or 0) ~= tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('set', KEYS[1], ARGV[2], 'ex', ARGV[3])
+    return 1
+    """)
+
+
+def set_if_version(key: str, version_key: str, version: int, value: str, ex: int) -> bool:
+    """
+    Cache the value built when version_key is at version, it's ignored if invalidated meanwhile.
+    Both keys must be in the same slot on cluster.
+    """
+    return bool(_set_if_version_script(keys=[key, version_key], args=[version, value, ex]))
+
+
+def meeting_tag(meeting_id: int) -> str:
+    """
+    Hash tag of the keys of a meeting, so that one script can change them on cluster,
+    while the meetings are spread over the slots
+    """
+    return f'{{meeting:{meeting_id}}}'
+
+
 def debug_time(func):
     def wrapper(*args, **kwargs):
         s = time.time()
@@ -41,27 +71,100 @@ def debug_time(func):
     return wrapper
 
 
-def acquire_lock_with_timeout(lock_name, room_id, acquire_timeout=3, lock_timeout=1) -> Optional[str]:
+class Lock(NamedTuple):
+    name: str
+    identifier: str  # unique to the holder, only the holder can extend or release the lock
+    fence: int  # increases on every acquire, a resource can reject writes of a stale holder with it
+
+
+LOCK_KEY = f'{REDIS_PREFIX}:lock:'
+
+_acquire_lock_script = client.register_script("""
+    if redis.call('set', KEYS[1], ARGV[1], 'nx', 'px', ARGV[2]) then
+        local fence = redis.call('incr', KEYS[2])
+        redis.call('expire', KEYS[2], ARGV[3])
+        return {1, fence}
+    end
+    return {0, redis.call('pttl', KEYS[1])}
+    """)
+
+_release_lock_script = client.register_script("""
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """)
+
+_extend_lock_script = client.register_script("""
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('pexpire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """)
+
+_metrics_lock = threading.Lock()
+_metrics = {'acquired': 0, 'contended': 0, 'timeout': 0, 'attempts': 0, 'wait_seconds': 0.0}
+
+
+def _lock_keys(lock_name: str) -> List[str]:
+    # the fence counter outlives the lock for DEFAULT_EXPIRE_TIME after the last acquire, and shares its slot
+    tag = f'{{{lock_name}}}'
+    return [LOCK_KEY + tag, LOCK_KEY + tag + ':fence']
+
+
+def acquire_lock_with_timeout(lock_name, room_id=None, acquire_timeout=3, lock_timeout=1) -> Optional[Lock]:
+    """
+    Try to acquire the lock for acquire_timeout seconds, the lock expires after lock_timeout seconds.
+    While the lock is held by others, wait with exponential backoff and full jitter, never longer than
+    the lock is left, so that waiting costs few Redis operations.
+    """
+    identifier = uuid.uuid4().hex
+    start = time.time()
+    end = start + acquire_timeout
+    backoff = 0.002
+    attempts = 0
+    while True:
+        attempts += 1
+        acquired, val = _acquire_lock_script(keys=_lock_keys(lock_name),
+                                             args=[identifier, int(lock_timeout * 1000), int(DEFAULT_EXPIRE_TIME)])
+        now = time.time()
+        if acquired or now >= end:
+            break
+        left = val / 1000 if val > 0 else backoff
+        time.sleep(min(random.uniform(0, backoff), left, end - now))
+        backoff = min(backoff * 2, 0.256)
+
+    with _metrics_lock:
+        _metrics['attempts'] += attempts
+        _metrics['wait_seconds'] += time.time() - start
+        _metrics['contended'] += attempts > 1
+        _metrics['acquired' if acquired else 'timeout'] += 1
+
+    if not acquired:
+        # a try without waiting is expected to fail under contention
+        if acquire_timeout > 0:
+            logger.warning(f'failed to acquire lock: {lock_name} of {room_id} after {attempts} attempts')
+        return None
+    return Lock(lock_name, identifier, val)
+
+
+def extend_lock(lock: Lock, lock_timeout=1) -> bool:
+    """
+    Reset the lock to expire after lock_timeout seconds, return False if the lock is lost
+    """
+    return bool(_extend_lock_script(keys=_lock_keys(lock.name)[:1], args=[lock.identifier, int(lock_timeout * 1000)]))
+
+
+def release_lock(lock: Lock) -> bool:
+    result = _release_lock_script(keys=_lock_keys(lock.name)[:1], args=[lock.identifier])
+    logger.debug(f'unlock: {lock.name} result: {result}')
+    return bool(result)
+
+
+def lock_metrics() -> Dict:
     """
-    lock_timeout: 1 seconds
+    Contention of locks in this process: acquired and timeout locks, acquires waited for others,
+    SET NX attempts and seconds spent on acquiring
     """
-    identifier = f'{room_id}-lock'
-    end = time.time() + acquire_timeout
-    while time.time() < end:
-        if client.set(lock_name, identifier, ex=lock_timeout, nx=True):
-            return identifier
-        time.sleep(0.001)
-    return None
-
-
-def release_lock(lock_name, identifier):
-    unlock_script = """
-        if redis.call("get",KEYS[1]) == ARGV[1] then
-            return redis.call("del",KEYS[1])
-        else
-            return 0
-        end
-        """
-    unlock = client.register_script(unlock_script)
-    result = unlock(keys=[lock_name], args=[identifier])
-    logger.debug(f'unlock: {lock_name} result: {result}')
+    with _metrics_lock:
+        return dict(_metrics)
@@ -1,25 +1,331 @@
+"""
+Scheduled tasks of different kinds, stored as ZSET members '<kind>:<key>' scored by due time,
+with optional JSON payload in a hash. A bare meeting number pushed by previous version is a meeting close task.
+The share user in payload of a task is released when the task is acked.
+"""
 import datetime
+import json
 import logging
-from typing import List
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
 
 from meeting_sample.settings import REDIS_PREFIX
-from utils.cache.connection import client
+from utils.cache.connection import client, HASH_TAG
+from utils.cache.share_user import SHARE_USER_KEY
 
 logger = logging.getLogger(__name__)
 
-DELAY_QUEUE = REDIS_PREFIX + ':delay_queue'
+# kinds of task
+MEETING_CLOSE = 'meeting_close'
+GROUP_CLOSE = 'group_close'
+POLL_STOP = 'poll_stop'
+SHARE_EXPIRE = 'share_expire'
 
+# tasks scored by due time
+DELAY_QUEUE = HASH_TAG + ':delay_queue'
+# claimed tasks scored by visibility deadline, they are due again if not acked before it
+DELAY_PROCESSING = HASH_TAG + ':delay_processing'
+# claimed times of tasks
+DELAY_ATTEMPTS = HASH_TAG + ':delay_attempts'
+# tasks failed too many times, scored by the time moved in
+DELAY_DEAD = HASH_TAG + ':delay_dead'
+# list to wake up a worker when a task is due earlier than the one it's waiting for
+DELAY_WAKE = HASH_TAG + ':delay_wake'
+# payload of tasks
+DELAY_PAYLOAD = HASH_TAG + ':delay_payload'
+# due and payload of tasks scheduled while being processed, they are scheduled when acked or retried
+DELAY_RESCHEDULE = HASH_TAG + ':delay_reschedule'
+# workers scored by the time they reported health
+DELAY_WORKERS = HASH_TAG + ':delay_workers'
+# health reported by a worker, expires if the worker is gone
+DELAY_WORKER_HEALTH = HASH_TAG + ':delay_worker:'
+# key used before the hash tag, moved by migrate_legacy_tasks
+_LEGACY_DELAY_QUEUE = REDIS_PREFIX + ':delay_queue'
 
-def push(meeting: int, expire_seconds: int) -> None:
-    mapping = {meeting: expire_seconds}
-    client.zadd(DELAY_QUEUE, mapping)
+
+class Task(NamedTuple):
+    member: str  # member in the queue, to ack or retry the task
+    kind: str
+    key: str
+    due: int
+    payload: Optional[Dict]
+
+
+# schedule(member, due, payload) is shared by push, and by ack and retry to apply a recorded reschedule
+_SCHEDULE = """
+    local function schedule(member, due, payload)
+        redis.call('zadd', KEYS[1], due, member)
+        redis.call('zrem', KEYS[4], member)
+        redis.call('hdel', KEYS[3], member)
+        redis.call('hdel', KEYS[7], member)
+        if payload ~= '' then
+            redis.call('hset', KEYS[6], member, payload)
+        else
+            redis.call('hdel', KEYS[6], member)
+        end
+        if redis.call('zrange', KEYS[1], 0, 0)[1] == member then
+            redis.call('rpush', KEYS[5], 1)
+            redis.call('ltrim', KEYS[5], 0, 0)
+        end
+    end
+
+    local function reschedule(member)
+        local val = redis.call('hget', KEYS[7], member)
+        if not val then
+            return false
+        end
+        local task = cjson.decode(val)
+        schedule(member, task['due'], task['payload'])
+        return true
+    end
+    """
+
+_push_script = client.register_script(_SCHEDULE + """
+    if redis.call('zscore', KEYS[2], ARGV[1]) then
+        redis.call('hset', KEYS[7], ARGV[1], cjson.encode({due = tonumber(ARGV[2]), payload = ARGV[3]}))
+        return 2
+    end
+    schedule(ARGV[1], ARGV[2], ARGV[3])
+    return 1
+    """)
+
+_claim_script = client.register_script("""
+    local now = tonumber(ARGV[1])
+    for _, item in ipairs(redis.call('zrangebyscore', KEYS[2], 0, now)) do
+        redis.call('zrem', KEYS[2], item)
+        redis.call('zadd', KEYS[1], now, item)
+    end
+    local items = redis.call('zrangebyscore', KEYS[1], 0, now, 'withscores', 'limit', 0, tonumber(ARGV[2]))
+    local result = {}
+    for i = 1, #items, 2 do
+        redis.call('zrem', KEYS[1], items[i])
+        redis.call('zadd', KEYS[2], now + tonumber(ARGV[3]), items[i])
+        redis.call('hincrby', KEYS[3], items[i], 1)
+        result[#result + 1] = items[i]
+        result[#result + 1] = items[i + 1]
+        result[#result + 1] = redis.call('hget', KEYS[6], items[i]) or ''
+    end
+    return result
+    """)
+
+_retry_script = client.register_script(_SCHEDULE + """
+    if redis.call('zrem', KEYS[2], ARGV[1]) == 0 then
+        return -1
+    end
+    if reschedule(ARGV[1]) then
+        return 1
+    end
+    local attempts = tonumber(redis.call('hget', KEYS[3], ARGV[1]) or 1)
+    if attempts >= tonumber(ARGV[3]) then
+        redis.call('hdel', KEYS[3], ARGV[1])
+        redis.call('zadd', KEYS[4], ARGV[2], ARGV[1])
+        return 0
+    end
+    local backoff = math.min(tonumber(ARGV[4]) * 2 ^ (attempts - 1), tonumber(ARGV[5]))
+    redis.call('zadd', KEYS[1], tonumber(ARGV[2]) + backoff, ARGV[1])
+    return 1
+    """)
+
+_ack_script = client.register_script(_SCHEDULE + """
+    redis.call('zrem', KEYS[2], ARGV[1])
+    if reschedule(ARGV[1]) then
+        return 2
+    end
+    local payload = redis.call('hget', KEYS[6], ARGV[1])
+    redis.call('zrem', KEYS[1], ARGV[1])
+    redis.call('hdel', KEYS[3], ARGV[1])
+    redis.call('hdel', KEYS[6], ARGV[1])
+    if payload then
+        local share_user = cjson.decode(payload)['share_user']
+        if type(share_user) == 'number' then
+            redis.call('srem', KEYS[8], string.format('%d', share_user))
+        end
+    end
+    return 1
+    """)
+
+_cancel_script = client.register_script("""
+    for i = 1, #ARGV do
+        redis.call('zrem', KEYS[1], ARGV[i])
+        redis.call('zrem', KEYS[2], ARGV[i])
+        redis.call('hdel', KEYS[3], ARGV[i])
+        redis.call('hdel', KEYS[6], ARGV[i])
+        redis.call('hdel', KEYS[7], ARGV[i])
+    end
+    return 1
+    """)
+
+
+def _keys() -> List[str]:
+    return [DELAY_QUEUE, DELAY_PROCESSING, DELAY_ATTEMPTS, DELAY_DEAD, DELAY_WAKE, DELAY_PAYLOAD, DELAY_RESCHEDULE,
+            SHARE_USER_KEY]
+
+
+def _now() -> int:
+    return int(datetime.datetime.utcnow().timestamp())
+
+
+def member(kind: str, key) -> str:
+    return f'{kind}:{key}'
+
+
+def _parse(item: bytes) -> (str, str):
+    item = item.decode()
+    if ':' not in item:
+        return MEETING_CLOSE, item
+    kind, key = item.split(':', 1)
+    return kind, key
+
+
+def schedule(kind: str, key, due: int, payload: Optional[Dict] = None) -> bool:
+    """
+    Schedule a task at due time, reschedule it if exists.
+    A task being processed is recorded, and scheduled again at due time when it's acked or retried.
+    """
+    return bool(_push_script(keys=_keys(), args=_push_args(kind, key, due, payload)))
+
+
+def schedule_after(kind: str, key, seconds: float, payload: Optional[Dict] = None) -> bool:
+    return schedule(kind, key, _now() + int(seconds), payload)
+
+
+def _push_args(kind: str, key, due: int, payload: Optional[Dict]) -> list:
+    return [member(kind, key), due, json.dumps(payload) if payload is not None else '']
+
+
+def cancel(kind: str, key) -> None:
+    _cancel_script(keys=_keys(), args=_cancel_args(kind, key))
+
+
+def _cancel_args(kind: str, key) -> List[str]:
+    members = [member(kind, key)]
+    if kind == MEETING_CLOSE:
+        members.append(str(key))
+    return members
+
+
+def push(meeting: int, expire_seconds: int, share_user_id: Optional[int] = None) -> bool:
+    """
+    Schedule to close the meeting at expire_seconds, its share user is released when the task is acked
+    """
+    return schedule(MEETING_CLOSE, meeting, expire_seconds, _close_payload(share_user_id))
+
+
+def _close_payload(share_user_id: Optional[int]) -> Optional[Dict]:
+    return {'share_user': share_user_id} if share_user_id is not None else None
 
 
 def pop(meeting: int) -> None:
-    client.zrem(DELAY_QUEUE, str(meeting))
+    cancel(MEETING_CLOSE, meeting)
+
+
+def claim(count: int, visibility_timeout: int) -> List[Task]:
+    """
+    Claim at most count due tasks of all kinds.
+    A claimed task is invisible to other workers for visibility_timeout seconds,
+    it's due again if not acked or retried in time.
+    """
+    now = _now()
+    items = _claim_script(keys=_keys(), args=[now, count, visibility_timeout])
+    tasks = []
+    for i in range(0, len(items), 3):
+        kind, key = _parse(items[i])
+        payload = json.loads(items[i + 2]) if items[i + 2] else None
+        tasks.append(Task(items[i].decode(), kind, key, int(float(items[i + 1])), payload))
+    return tasks
+
+
+def next_due() -> Optional[float]:
+    """
+    Seconds to the next due task or visibility deadline, None if nothing is scheduled
+    """
+    pipe = client.pipeline()
+    pipe.zrange(DELAY_QUEUE, 0, 0, withscores=True)
+    pipe.zrange(DELAY_PROCESSING, 0, 0, withscores=True)
+    scores = [x[0][1] for x in pipe.execute() if x]
+    if not scores:
+        return None
+    return max(min(scores) - datetime.datetime.utcnow().timestamp(), 0)
+
+
+def wait(timeout: float):
+    """
+    Sleep timeout seconds, or until a task is scheduled ahead of all others
+    """
+    if timeout < 1:
+        # BLPOP blocks in whole seconds
+        time.sleep(timeout)
+        return
+    client.blpop([DELAY_WAKE], timeout=int(timeout))
+
+
+def ack(task_member: str) -> None:
+    """
+    The claimed task is processed, it's scheduled again if rescheduled while being processed,
+    otherwise the share user in its payload is released
+    """
+    _ack_script(keys=_keys(), args=[task_member])
+
+
+def retry(task_member: str, max_attempts: int, backoff: int, max_backoff: int = 600) -> bool:
+    """
+    Schedule the claimed task again with exponential backoff, or at the time rescheduled while being processed,
+    return False if it's moved to the dead-letter set after max_attempts.
+    """
+    return _retry_script(keys=_keys(), args=[task_member, _now(), max_attempts, backoff, max_backoff]) != 0
+
+
+def report_health(worker: str, health: Dict, ex: int) -> None:
+    """
+    Report health of the worker, it's regarded as gone if not reported again in ex seconds
+    """
+    now = _now()
+    pipe = client.pipeline()
+    pipe.set(DELAY_WORKER_HEALTH + worker, json.dumps(health), ex=ex)
+    pipe.zadd(DELAY_WORKERS, {worker: now})
+    pipe.zremrangebyscore(DELAY_WORKERS, 0, now - 24 * 3600)
+    pipe.execute()
+
+
+def workers_health(within: int) -> Dict[str, Dict]:
+    """
+    Health of the workers reported in within seconds
+    """
+    workers = [v.decode() for v in client.zrangebyscore(DELAY_WORKERS, _now() - within, '+inf')]
+    if not workers:
+        return {}
+    values = client.mget([DELAY_WORKER_HEALTH + x for x in workers])
+    return {k: json.loads(v) for k, v in zip(workers, values) if v is not None}
+
+
+def stats() -> Dict[str, int]:
+    """
+    Numbers of queued, processing and dead tasks
+    """
+    pipe = client.pipeline()
+    pipe.zcard(DELAY_QUEUE)
+    pipe.zcard(DELAY_PROCESSING)
+    pipe.zcard(DELAY_DEAD)
+    queued, processing, dead = pipe.execute()
+    return {'queued': queued, 'processing': processing, 'dead': dead}
+
+
+def dead_letters() -> List[str]:
+    return [v.decode() for v in client.zrange(DELAY_DEAD, 0, -1)]
 
 
-def retrieve() -> List[int]:
-    max_score = int(datetime.datetime.utcnow().timestamp())
-    val = client.zrangebyscore(DELAY_QUEUE, 0, max_score)
-    return [int(v) for v in val]
+def migrate_legacy_tasks(share_users: Callable[[List[int]], Dict[int, Optional[int]]]) -> int:
+    """
+    Move the meetings waiting to be closed in the delay queue of previous version, return number of them.
+    share_users: return the share user of the meetings, released when they are closed
+    The legacy key is in another slot on cluster, so the tasks are scheduled before removed from it.
+    """
+    mapping = client.zrange(_LEGACY_DELAY_QUEUE, 0, -1, withscores=True)
+    if not mapping:
+        return 0
+    ids = share_users([int(x) for x, _ in mapping])
+    for meeting, due in mapping:
+        push(int(meeting), int(due), ids.get(int(meeting)))
+    client.zrem(_LEGACY_DELAY_QUEUE, *[x for x, _ in mapping])
+    logger.info(f'moved {len(mapping)} meetings from the delay queue of previous version')
+    return len(mapping)
@@ -2,27 +2,26 @@ import json
 from typing import Dict, Optional
 
 from meeting_sample.settings import REDIS_PREFIX
-from utils.cache.connection import client, acquire_lock_with_timeout, release_lock
+from utils.cache.connection import client, meeting_tag
 
 MEETING_GROUP_KEY = f'{REDIS_PREFIX}:meeting:group:'
 
 
+def _key(meeting_id: int) -> str:
+    return MEETING_GROUP_KEY + meeting_tag(meeting_id)
+
+
 # @debug_time
 def open_group(meeting_id: int, group_info: dict, ex: int) -> bool:
     """
     meeting_id: Meeting ID
     """
-    lock_name = f'new-group-lock-{meeting_id}'
-    key = MEETING_GROUP_KEY + str(meeting_id)
+    key = _key(meeting_id)
 
     info = json.dumps(group_info)
 
-    locker = acquire_lock_with_timeout(lock_name, meeting_id, 10, 10)
-    if locker is None:
-        raise RuntimeError(f'can not lock room: {lock_name}')
+    # SET NX is atomic, no lock is needed
     val = client.set(key, info, nx=True, ex=ex)
-    release_lock(lock_name, locker)
-
     if val:
         return True
 
@@ -35,12 +34,12 @@ def close_group(meeting_id: int):
     """
     meeting_id: Meeting ID
     """
-    key = MEETING_GROUP_KEY + str(meeting_id)
+    key = _key(meeting_id)
     client.delete(key)
 
 
 def get_group_info(meeting_id) -> Optional[Dict]:
-    key = MEETING_GROUP_KEY + str(meeting_id)
+    key = _key(meeting_id)
     val = client.get(key)
     if val is None:
         return None
@@ -49,7 +48,7 @@ def get_group_info(meeting_id) -> Optional[Dict]:
 
 
 def update_group_info(meeting_id: int, group_info: Dict) -> bool:
-    key = MEETING_GROUP_KEY + str(meeting_id)
+    key = _key(meeting_id)
 
     info = json.dumps(group_info)
     val = client.set(key, info, xx=True)
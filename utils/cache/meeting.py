@@ -1,42 +1,310 @@
-from meeting_sample.settings import REDIS_PREFIX
-from utils.cache.connection import client
+import json
+import logging
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from meeting_sample.settings import REDIS_PREFIX, SHARE_LEASE_TIME
+from utils.cache import delay_queue
+from utils.cache.connection import acquire_lock_with_timeout, client, Lock, meeting_tag, release_lock, set_if_version
+from utils.cache.group import MEETING_GROUP_KEY
+
+logger = logging.getLogger(__name__)
 
 MEETING_KEY = f'{REDIS_PREFIX}:meeting:'
+MEETING_SHARE_KEY = f'{REDIS_PREFIX}:meeting_share:'
+MEETING_SHARE_WAKE_KEY = f'{REDIS_PREFIX}:meeting_share_wake:'
+CALL_SEQUENCE_KEY = f'{REDIS_PREFIX}:meeting_call_sequence'
+# keys of meeting and its groups used before the hash tag of meeting
+_LEGACY_MEETING_KEY = re.compile(rf'^{re.escape(REDIS_PREFIX)}:meeting:(group:)?(\d+)$')
+
+# never INCR a lost counter from zero, it would reuse the sequences
+_next_sequence_script = client.register_script("""
+    if redis.call('exists', KEYS[1]) == 0 then
+        return false
+    end
+    return redis.call('incr', KEYS[1])
+    """)
+
+
+# Lifecycle of a meeting in cache, the keys of a meeting are changed by one script in its slot.
+# Opening also schedules the close task in the global slot, the only other round trip,
+# and the share user is released when the close task is acked.
+_open_script = client.register_script("""
+    redis.call('hset', KEYS[1], 'open', 1)
+    redis.call('expire', KEYS[1], ARGV[1])
+    return 1
+    """)
+
+_close_script = client.register_script("""
+    redis.call('del', KEYS[1], KEYS[2], KEYS[3])
+    redis.call('rpush', KEYS[4], 0)
+    redis.call('expire', KEYS[4], 1)
+    return 1
+    """)
+
+# legacy hash fields are kept, the sharing user takes the lease and renews it by heartbeat
+_migrate_script = client.register_script("""
+    if redis.call('exists', KEYS[1]) == 1 then
+        return 0
+    end
+    for i = 4, #ARGV, 2 do
+        redis.call('hset', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+    redis.call('hset', KEYS[1], 'open', 1)
+    redis.call('expire', KEYS[1], ARGV[1])
+    if tonumber(ARGV[2]) > 0 then
+        redis.call('set', KEYS[2], ARGV[2], 'px', ARGV[3])
+    end
+    return 1
+    """)
+
+_lookup_script = client.register_script("""
+    if redis.call('exists', KEYS[1]) == 0 then
+        return {-1, redis.call('get', KEYS[2])}
+    end
+    return {tonumber(redis.call('get', KEYS[3]) or 0), redis.call('get', KEYS[2])}
+    """)
+
+
+def _meeting_key(meeting_id: int) -> str:
+    return MEETING_KEY + meeting_tag(meeting_id)
+
+
+def _meeting_keys(meeting_id: int) -> List[str]:
+    tag = meeting_tag(meeting_id)
+    return [MEETING_KEY + tag, MEETING_GROUP_KEY + tag, MEETING_SHARE_KEY + tag]
+
+
+def open_meeting(meeting_id: int, ex: int, close_at: int, share_user_id: Optional[int] = None):
+    """
+    Push the meeting to the delay queue to be closed at close_at, and open it in cache for ex seconds.
+    The close task is pushed first, so a meeting left open by a failure between is still closed.
+    """
+    delay_queue.push(meeting_id, close_at, share_user_id)
+    _open_script(keys=[_meeting_key(meeting_id)], args=[ex])
+
 
+def lookup_meeting(meeting_id: int) -> Tuple[int, Optional[List[Dict]]]:
+    """
+    Return (sharing user, group info) for a participant joining the meeting, sharing user is -1 if not open
+    """
+    return _parse_lookup(_lookup_script(keys=_meeting_keys(meeting_id)))
 
-def open_meeting(meeting_id: int, ex: int):
-    key = MEETING_KEY + str(meeting_id)
 
-    value = {
-        'sharing_user': 0,
-    }
-    client.hset(key, mapping=value)
-    client.expire(key, ex)
+def _parse_lookup(result) -> Tuple[int, Optional[List[Dict]]]:
+    sharing_user, group_info = result
+    return int(sharing_user), json.loads(group_info) if group_info is not None else None
 
 
 def close_meeting(meeting_id: int):
-    key = MEETING_KEY + str(meeting_id)
-    client.delete(key)
+    """
+    Remove the meeting, its groups and share lease from cache, and wake up the users waiting for the lease.
+    It's called by the close task, which pops the meeting from the delay queue and releases its share user on ack.
+    """
+    _close_script(keys=_meeting_keys(meeting_id) + [_share_keys(meeting_id)[1]])
+
+
+def migrate_legacy_meetings() -> int:
+    """
+    Copy the open meetings and groups cached by previous version to the keys tagged by meeting,
+    with all fields of the meeting and its sharing user, the legacy keys are left to expire.
+    Return number of the keys copied.
+    """
+    copied = 0
+    for key in client.scan_iter(match=f'{REDIS_PREFIX}:meeting:*', count=1000):
+        matched = _LEGACY_MEETING_KEY.match(key.decode())
+        if matched is None:
+            continue
+        is_group, meeting_id = matched.group(1), int(matched.group(2))
+        pipe = client.pipeline()
+        pipe.ttl(key)
+        if is_group:
+            pipe.get(key)
+        else:
+            pipe.hgetall(key)
+        ttl, val = pipe.execute()
+        if ttl <= 0 or not val:
+            continue
+        if is_group:
+            copied += bool(client.set(MEETING_GROUP_KEY + meeting_tag(meeting_id), val, nx=True, ex=ttl))
+        else:
+            fields = [x for item in val.items() for x in item]
+            sharing_user = int(val.get(b'sharing_user', 0))
+            keys = [_meeting_key(meeting_id), _share_keys(meeting_id)[0]]
+            copied += _migrate_script(keys=keys, args=[ttl, sharing_user, SHARE_LEASE_TIME * 1000] + fields)
+    logger.info(f'copied {copied} keys of meetings cached by previous version')
+    return copied
+
+
+# Lease of screen share, the holder renews it by heartbeat before it expires
+_acquire_share_script = client.register_script("""
+    if redis.call('exists', KEYS[1]) == 0 then
+        return {-1, 0}
+    end
+    local holder = redis.call('get', KEYS[2])
+    if holder and holder ~= ARGV[1] then
+        return {tonumber(holder), redis.call('pttl', KEYS[2])}
+    end
+    redis.call('set', KEYS[2], ARGV[1], 'px', ARGV[2])
+    return {0, tonumber(ARGV[2])}
+    """)
+
+_renew_share_script = client.register_script("""
+    if redis.call('get', KEYS[1]) ~= ARGV[1] then
+        return 0
+    end
+    redis.call('pexpire', KEYS[1], ARGV[2])
+    return 1
+    """)
+
+_release_share_script = client.register_script("""
+    if redis.call('get', KEYS[1]) ~= ARGV[1] then
+        return 0
+    end
+    redis.call('del', KEYS[1], KEYS[2])
+    redis.call('rpush', KEYS[2], ARGV[1])
+    redis.call('expire', KEYS[2], 1)
+    return 1
+    """)
+
+
+def _share_keys(meeting_id: int) -> List[str]:
+    tag = meeting_tag(meeting_id)
+    return [MEETING_SHARE_KEY + tag, MEETING_SHARE_WAKE_KEY + tag]
 
 
 def get_sharing_user(meeting_id: int) -> int:
-    key = MEETING_KEY + str(meeting_id)
-    val = client.hget(key, 'sharing_user')
-    if val is None:
+    """
+    Return the sharing user, 0 if nobody is sharing, -1 if the meeting is not open
+    """
+    pipe = client.pipeline()
+    pipe.exists(_meeting_key(meeting_id))
+    pipe.get(_share_keys(meeting_id)[0])
+    return _parse_sharing_user(*pipe.execute())
+
+
+def _parse_sharing_user(opened: int, holder: Optional[bytes]) -> int:
+    if not opened:
         return -1
-    return int(val)
+    return int(holder) if holder is not None else 0
+
+
+def acquire_share(meeting_id: int, user_id: int, lease: int) -> Tuple[int, int]:
+    """
+    Take or renew the share lease for lease milliseconds.
+    Return (0, lease) if the user holds the lease, (-1, 0) if the meeting is not open,
+    or (sharing user, milliseconds left of the lease) if other is sharing.
+    """
+    holder, ttl = _acquire_share_script(keys=_acquire_share_keys(meeting_id), args=[user_id, lease])
+    return int(holder), int(ttl)
 
 
-def start_share(meeting_id: int, user_id: int):
-    key = MEETING_KEY + str(meeting_id)
-    client.hset(key, 'sharing_user', user_id)
+def _acquire_share_keys(meeting_id: int) -> List[str]:
+    return [_meeting_key(meeting_id), _share_keys(meeting_id)[0]]
 
 
-def stop_share(meeting_id: int):
-    key = MEETING_KEY + str(meeting_id)
-    client.hset(key, 'sharing_user', 0)
+def renew_share(meeting_id: int, user_id: int, lease: int) -> bool:
+    """
+    Heartbeat of the sharing user, return False if the lease is lost
+    """
+    return bool(_renew_share_script(keys=_share_keys(meeting_id)[:1], args=[user_id, lease]))
+
+
+def release_share(meeting_id: int, user_id: int) -> bool:
+    """
+    Release the lease held by the user, and wake up a user waiting for it
+    """
+    return bool(_release_share_script(keys=_share_keys(meeting_id), args=[user_id]))
+
+
+def wake_share(meeting_id: int):
+    """
+    Wake up a user waiting for the lease, it's called when the lease is expired without release
+    """
+    wake_key = _share_keys(meeting_id)[1]
+    pipe = client.pipeline()
+    pipe.rpush(wake_key, 0)
+    pipe.expire(wake_key, 1)
+    pipe.execute()
+
+
+def wait_share(meeting_id: int, timeout: float) -> bool:
+    """
+    Block until the lease is released or timeout, return True if woken up by the release
+    """
+    return client.blpop([_share_keys(meeting_id)[1]], timeout=max(1, int(timeout))) is not None
 
 
 def is_meeting_open(meeting_id: int) -> bool:
-    key = MEETING_KEY + str(meeting_id)
-    return bool(client.exists(key))
+    return bool(client.exists(_meeting_key(meeting_id)))
+
+
+def next_call_sequence(last_sequence: Callable[[], int]) -> int:
+    """
+    Allocate a sequence of call number, unique across workers.
+    last_sequence: return the last sequence in database, to restore the counter if it's lost
+    """
+    val = _next_sequence_script(keys=[CALL_SEQUENCE_KEY])
+    if val is None:
+        client.set(CALL_SEQUENCE_KEY, last_sequence(), nx=True)
+        val = _next_sequence_script(keys=[CALL_SEQUENCE_KEY])
+    return int(val)
+
+
+# Snapshot of meeting row, read by every participant in a meeting
+MEETING_SNAPSHOT_KEY = f'{REDIS_PREFIX}:meeting_snapshot:'
+MEETING_SNAPSHOT_VERSION_KEY = f'{REDIS_PREFIX}:meeting_snapshot_version:'
+SNAPSHOT_EXPIRE_TIME = 5 * 60  # seconds
+MISSING_EXPIRE_TIME = 10  # seconds, for the meeting not found
+
+
+def _snapshot_keys(meeting_id: int) -> List[str]:
+    tag = f'{{{meeting_id}}}'
+    return [MEETING_SNAPSHOT_KEY + tag, MEETING_SNAPSHOT_VERSION_KEY + tag]
+
+
+def get_meeting_snapshot(meeting_id: int) -> Tuple[int, bool, Optional[Dict]]:
+    """
+    Return (current version, cached, snapshot), snapshot is None if the meeting is not found
+    """
+    return _parse_snapshot(*client.mget(_snapshot_keys(meeting_id)))
+
+
+def _parse_snapshot(val: Optional[bytes], version: Optional[bytes]) -> Tuple[int, bool, Optional[Dict]]:
+    version = int(version) if version is not None else 0
+    if val is None:
+        return version, False, None
+
+    snapshot = json.loads(val)
+    if snapshot['version'] != version:
+        return version, False, None
+    return version, True, snapshot['meeting']
+
+
+def set_meeting_snapshot(meeting_id: int, version: int, snapshot: Optional[Dict]):
+    """
+    Cache the snapshot read when version is current, it's ignored if invalidated meanwhile
+    """
+    key, version_key = _snapshot_keys(meeting_id)
+    ex = SNAPSHOT_EXPIRE_TIME if snapshot is not None else MISSING_EXPIRE_TIME
+    set_if_version(key, version_key, version, json.dumps({'version': version, 'meeting': snapshot}), ex)
+
+
+def invalidate_meeting_snapshot(meeting_id: int):
+    key, version_key = _snapshot_keys(meeting_id)
+    pipe = client.pipeline()
+    pipe.incr(version_key)
+    pipe.expire(version_key, 2 * SNAPSHOT_EXPIRE_TIME)
+    pipe.delete(key)
+    pipe.execute()
+
+
+def lock_meeting_snapshot(meeting_id: int, ex: int = 3) -> Optional[Lock]:
+    """
+    Only the request holding the lock loads the meeting from database on miss, return None if held by others
+    """
+    return acquire_lock_with_timeout(f'meeting_snapshot:{meeting_id}', meeting_id, acquire_timeout=0, lock_timeout=ex)
+
+
+def unlock_meeting_snapshot(lock: Lock):
+    release_lock(lock)
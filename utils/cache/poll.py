@@ -0,0 +1,384 @@
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+from meeting_sample.settings import REDIS_PREFIX
+from utils.cache.connection import client, DEFAULT_EXPIRE_TIME, set_if_version
+
+POLL_VOTE_KEY = f'{REDIS_PREFIX}:poll:vote:'
+POLL_VOTER_KEY = f'{REDIS_PREFIX}:poll:voter:'
+POLL_BALLOT_KEY = f'{REDIS_PREFIX}:poll:ballot:'
+
+# Field in vote hash, means the counters are consistent with database
+_READY = '_ready'
+
+_cast_script = client.register_script("""
+    local old = redis.call('hget', KEYS[3], ARGV[2])
+    if old and ARGV[4] == '0' then
+        return {0, old}
+    end
+    redis.call('hset', KEYS[3], ARGV[2], ARGV[3])
+    redis.call('expire', KEYS[3], ARGV[5])
+    if redis.call('hexists', KEYS[1], ARGV[1]) == 1 then
+        if old then
+            for _, option in ipairs(cjson.decode(old)) do
+                redis.call('hincrby', KEYS[1], option, -1)
+            end
+        end
+        for _, option in ipairs(cjson.decode(ARGV[3])) do
+            redis.call('hincrby', KEYS[1], option, 1)
+        end
+        redis.call('sadd', KEYS[2], ARGV[2])
+    end
+    return {1, old or ''}
+    """)
+
+_withdraw_script = client.register_script("""
+    if redis.call('hget', KEYS[3], ARGV[2]) ~= ARGV[3] then
+        return 0
+    end
+    if ARGV[4] == '' then
+        redis.call('hdel', KEYS[3], ARGV[2])
+    else
+        redis.call('hset', KEYS[3], ARGV[2], ARGV[4])
+    end
+    if redis.call('hexists', KEYS[1], ARGV[1]) == 1 then
+        for _, option in ipairs(cjson.decode(ARGV[3])) do
+            redis.call('hincrby', KEYS[1], option, -1)
+        end
+        if ARGV[4] == '' then
+            redis.call('srem', KEYS[2], ARGV[2])
+        else
+            for _, option in ipairs(cjson.decode(ARGV[4])) do
+                redis.call('hincrby', KEYS[1], option, 1)
+            end
+        end
+    end
+    return 1
+    """)
+
+_rebuild_script = client.register_script("""
+    if redis.call('hexists', KEYS[1], ARGV[1]) == 1 then
+        return 0
+    end
+    redis.call('del', KEYS[1], KEYS[2])
+    for option, count in pairs(cjson.decode(ARGV[3])) do
+        redis.call('hset', KEYS[1], option, count)
+    end
+    for _, voter in ipairs(cjson.decode(ARGV[4])) do
+        redis.call('sadd', KEYS[2], voter)
+    end
+    redis.call('hset', KEYS[1], ARGV[1], 1)
+    redis.call('expire', KEYS[1], ARGV[2])
+    redis.call('expire', KEYS[2], ARGV[2])
+    return 1
+    """)
+
+
+def _keys(poll_id: int, _round: int) -> List[str]:
+    # hash tag keeps all keys of a round in the same slot of cluster
+    tag = f'{{{poll_id}:{_round}}}'
+    return [POLL_VOTE_KEY + tag, POLL_VOTER_KEY + tag, POLL_BALLOT_KEY + tag]
+
+
+def reset_votes(poll_id: int, _round: int):
+    """
+    Start counting a new round from zero
+    """
+    vote_key, voter_key, ballot_key = _keys(poll_id, _round)
+    pipe = client.pipeline()
+    pipe.delete(vote_key)
+    pipe.delete(voter_key)
+    pipe.delete(ballot_key)
+    pipe.hset(vote_key, _READY, 1)
+    pipe.expire(vote_key, int(DEFAULT_EXPIRE_TIME))
+    pipe.execute()
+
+
+def cast_ballot(poll_id: int, _round: int, voter: int, options: List[int],
+                replace: bool = False) -> Tuple[bool, Optional[List[int]]]:
+    """
+    Admit one ballot per voter in a round, and add its votes to counters.
+    replace: replace the previous ballot of the voter instead of rejecting it
+    Return (admitted, options of previous ballot or None).
+    """
+    return _parse_cast(_cast_script(keys=_keys(poll_id, _round), args=_cast_args(voter, options, replace)))
+
+
+def _cast_args(voter: int, options: List[int], replace: bool) -> list:
+    return [_READY, voter, json.dumps(options), int(replace), int(DEFAULT_EXPIRE_TIME)]
+
+
+def _parse_cast(result) -> Tuple[bool, Optional[List[int]]]:
+    admitted, old = result
+    return bool(admitted), (json.loads(old) if old else None)
+
+
+def withdraw_ballot(poll_id: int, _round: int, voter: int, options: List[int], old: Optional[List[int]]) -> bool:
+    """
+    Revert cast_ballot if the ballot is failed to persist
+    """
+    return bool(_withdraw_script(keys=_keys(poll_id, _round), args=_withdraw_args(voter, options, old)))
+
+
+def _withdraw_args(voter: int, options: List[int], old: Optional[List[int]]) -> list:
+    return [_READY, voter, json.dumps(options), json.dumps(old) if old is not None else '']
+
+
+def get_ballot(poll_id: int, _round: int, voter: int) -> Optional[List[int]]:
+    """
+    Return options of a voter's ballot in the round
+    """
+    val = client.hget(_keys(poll_id, _round)[2], voter)
+    if val is None:
+        return None
+    return json.loads(val)
+
+
+def get_votes(poll_id: int, _round: int) -> Optional[Tuple[Dict[int, int], int]]:
+    """
+    Return ({option ID: count}, voter number), None if the counters are lost
+    """
+    vote_key, voter_key, _ = _keys(poll_id, _round)
+    pipe = client.pipeline()
+    pipe.hgetall(vote_key)
+    pipe.scard(voter_key)
+    counts, voter_num = pipe.execute()
+
+    if _READY.encode() not in counts:
+        return None
+    counts.pop(_READY.encode())
+    return {int(k): int(v) for k, v in counts.items()}, voter_num
+
+
+def rebuild_votes(poll_id: int, _round: int, counts: Dict[int, int], voters: List[int]) -> bool:
+    """
+    Rebuild counters from database, skipped if the counters are already there
+    """
+    args = [_READY, int(DEFAULT_EXPIRE_TIME), json.dumps({str(k): v for k, v in counts.items()}), json.dumps(voters)]
+    return bool(_rebuild_script(keys=_keys(poll_id, _round)[:2], args=args))
+
+
+# Write-behind buffer of ballots, keys share a hash tag so that scripts work in cluster
+_BUFFER_TAG = f'{{{REDIS_PREFIX}:poll:buffer}}'
+POLL_BUFFER_KEY = f'{_BUFFER_TAG}:queue'
+# claimed batches scored by visibility deadline, they are put back to the buffer if not acked before it
+POLL_BATCHES_KEY = f'{_BUFFER_TAG}:batches'
+# ballots of claimed batches, JSON array by batch ID
+POLL_BATCH_ITEMS_KEY = f'{_BUFFER_TAG}:batch_items'
+POLL_BATCH_SEQUENCE_KEY = f'{_BUFFER_TAG}:batch_sequence'
+POLL_PENDING_KEY = f'{_BUFFER_TAG}:pending'
+# marks a round being stopped, its ballots are not accepted any more
+POLL_CLOSED_KEY = f'{_BUFFER_TAG}:closed:'
+
+_buffer_script = client.register_script("""
+    if redis.call('exists', KEYS[3]) == 1 then
+        return -1
+    end
+    if redis.call('llen', KEYS[1]) >= tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('rpush', KEYS[1], ARGV[3])
+    redis.call('hincrby', KEYS[2], ARGV[2], 1)
+    return 1
+    """)
+
+_claim_script = client.register_script("""
+    local now = tonumber(ARGV[1])
+    for _, batch in ipairs(redis.call('zrangebyscore', KEYS[2], 0, now)) do
+        local items = cjson.decode(redis.call('hget', KEYS[3], batch) or '[]')
+        for i = #items, 1, -1 do
+            redis.call('lpush', KEYS[1], items[i])
+        end
+        redis.call('hdel', KEYS[3], batch)
+        redis.call('zrem', KEYS[2], batch)
+    end
+    local items = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+    if #items == 0 then
+        return {}
+    end
+    redis.call('ltrim', KEYS[1], #items, -1)
+    local batch = redis.call('incr', KEYS[4])
+    redis.call('hset', KEYS[3], batch, cjson.encode(items))
+    redis.call('zadd', KEYS[2], now + tonumber(ARGV[3]), batch)
+    return {batch, items}
+    """)
+
+_ack_script = client.register_script("""
+    if redis.call('zrem', KEYS[1], ARGV[1]) == 0 then
+        return 0
+    end
+    local items = cjson.decode(redis.call('hget', KEYS[2], ARGV[1]) or '[]')
+    redis.call('hdel', KEYS[2], ARGV[1])
+    local counts = {}
+    for _, item in ipairs(items) do
+        local poll = string.format('%d', cjson.decode(item)['poll'])
+        counts[poll] = (counts[poll] or 0) + 1
+    end
+    for poll, count in pairs(counts) do
+        if redis.call('hincrby', KEYS[3], poll, -count) <= 0 then
+            redis.call('hdel', KEYS[3], poll)
+        end
+    end
+    return 1
+    """)
+
+def buffer_ballot(poll_id: int, _round: int, voter: int, options: List[Tuple[int, int]], limit: int,
+                  replace: bool = False) -> int:
+    """
+    Append a ballot to the write-behind buffer.
+    options: list of (question ID, option ID)
+    replace: the ballot replaces previous ballot of the voter
+    Return 1 if it's buffered, 0 if the buffer is full, -1 if the round is closed.
+    """
+    keys, args = _buffer_params(poll_id, _round, voter, options, limit, replace)
+    return int(_buffer_script(keys=keys, args=args))
+
+
+def _buffer_params(poll_id: int, _round: int, voter: int, options: List[Tuple[int, int]], limit: int,
+                   replace: bool) -> Tuple[List[str], list]:
+    ballot = json.dumps({'poll': poll_id, 'round': _round, 'voter': voter, 'options': options, 'replace': replace})
+    keys = [POLL_BUFFER_KEY, POLL_PENDING_KEY, f'{POLL_CLOSED_KEY}{poll_id}:{_round}']
+    return keys, [limit, poll_id, ballot]
+
+
+def close_ballots(poll_id: int, _round: int):
+    """
+    Stop accepting ballots of a round into the buffer, the buffered ones are still flushed
+    """
+    client.set(f'{POLL_CLOSED_KEY}{poll_id}:{_round}', 1, ex=DEFAULT_EXPIRE_TIME)
+
+
+def claim_ballots(count: int, visibility_timeout: int) -> Tuple[Optional[int], List[bytes]]:
+    """
+    Claim at most count ballots from the buffer as a batch, return (batch ID, JSON encoded ballots).
+    The batch is put back to the buffer if it's not acked in visibility_timeout seconds,
+    so the ballots will not be lost if the worker crashed.
+    """
+    keys = [POLL_BUFFER_KEY, POLL_BATCHES_KEY, POLL_BATCH_ITEMS_KEY, POLL_BATCH_SEQUENCE_KEY]
+    result = _claim_script(keys=keys, args=[int(time.time()), count, visibility_timeout])
+    if not result:
+        return None, []
+    batch, items = result
+    return int(batch), items
+
+
+def ack_ballots(batch: int):
+    """
+    Drop the persisted batch, and count its ballots as persisted
+    """
+    _ack_script(keys=[POLL_BATCHES_KEY, POLL_BATCH_ITEMS_KEY, POLL_PENDING_KEY], args=[batch])
+
+
+def release_ballots(batch: int):
+    """
+    Put the batch failed to persist back to the buffer at the next claim
+    """
+    client.zadd(POLL_BATCHES_KEY, {batch: 0}, xx=True)
+
+
+def pending_ballots(poll_id: int) -> int:
+    """
+    Number of accepted ballots of a poll not persisted yet
+    """
+    val = client.hget(POLL_PENDING_KEY, poll_id)
+    if val is None:
+        return 0
+    return int(val)
+
+
+# Snapshot of poll definition, it's read only while the poll is going
+POLL_DEFINITION_KEY = f'{REDIS_PREFIX}:poll:definition:'
+POLL_VERSION_KEY = f'{REDIS_PREFIX}:poll:version:'
+
+
+def _definition_keys(poll_id: int) -> List[str]:
+    tag = f'{{{poll_id}}}'
+    return [POLL_DEFINITION_KEY + tag, POLL_VERSION_KEY + tag]
+
+
+def get_definition(poll_id: int) -> Tuple[int, Optional[Dict]]:
+    """
+    Return (current version, definition), definition is None if not cached or out of date
+    """
+    val, version = client.mget(_definition_keys(poll_id))
+    version = int(version) if version is not None else 0
+    if val is None:
+        return version, None
+
+    definition = json.loads(val)
+    if definition.pop('version', None) != version:
+        return version, None
+    return version, definition
+
+
+def set_definition(poll_id: int, version: int, definition: Dict):
+    """
+    Cache the definition built when version is current, it's ignored if invalidated meanwhile
+    """
+    key, version_key = _definition_keys(poll_id)
+    set_if_version(key, version_key, version, json.dumps({**definition, 'version': version}), int(DEFAULT_EXPIRE_TIME))
+
+
+def invalidate_definition(poll_id: int):
+    key, version_key = _definition_keys(poll_id)
+    pipe = client.pipeline()
+    pipe.incr(version_key)
+    # outlive the definitions, or the version may go back to a stale one
+    pipe.expire(version_key, 2 * int(DEFAULT_EXPIRE_TIME))
+    pipe.delete(key)
+    pipe.execute()
+
+
+# Poll list of a meeting with the owner and status of the meeting
+POLL_LIST_KEY = f'{REDIS_PREFIX}:poll:list:'
+POLL_LIST_VERSION_KEY = f'{REDIS_PREFIX}:poll:list_version:'
+
+
+def _poll_list_keys(meeting_id: int) -> List[str]:
+    tag = f'{{{meeting_id}}}'
+    return [POLL_LIST_KEY + tag, POLL_LIST_VERSION_KEY + tag]
+
+
+def get_poll_list(meeting_id: int) -> Tuple[int, Optional[Dict]]:
+    """
+    Return (current version, poll list), poll list is None if not cached or out of date
+    """
+    val, version = client.mget(_poll_list_keys(meeting_id))
+    version = int(version) if version is not None else 0
+    if val is None:
+        return version, None
+
+    poll_list = json.loads(val)
+    if poll_list.pop('version', None) != version:
+        return version, None
+    return version, poll_list
+
+
+def set_poll_list(meeting_id: int, version: int, poll_list: Dict):
+    """
+    Cache the poll list built when version is current, it's ignored if invalidated meanwhile
+    """
+    key, version_key = _poll_list_keys(meeting_id)
+    set_if_version(key, version_key, version, json.dumps({**poll_list, 'version': version}), int(DEFAULT_EXPIRE_TIME))
+
+
+def invalidate_poll_list(meeting_id: int):
+    key, version_key = _poll_list_keys(meeting_id)
+    pipe = client.pipeline()
+    pipe.incr(version_key)
+    pipe.expire(version_key, 2 * int(DEFAULT_EXPIRE_TIME))
+    pipe.delete(key)
+    pipe.execute()
+
+
+# Events of polls, all processes subscribe the channel and fan out to their streams
+POLL_EVENT_CHANNEL = f'{REDIS_PREFIX}:poll:event'
+
+
+def publish_event(poll_id: int, event: str, data: Dict) -> int:
+    return client.publish(POLL_EVENT_CHANNEL, _event_message(poll_id, event, data))
+
+
+def _event_message(poll_id: int, event: str, data: Dict) -> str:
+    return json.dumps({'poll': poll_id, 'event': event, 'data': data})
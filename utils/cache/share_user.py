@@ -1,21 +1,51 @@
 import random
+from typing import List
 
 from meeting_sample.settings import REDIS_PREFIX
-from utils.cache.connection import client
+from utils.cache.connection import client, HASH_TAG
 
-_KEY = f'{REDIS_PREFIX}:share_user'
+# IDs in use, claimed by SADD so that allocation and release are O(1) and atomic
+SHARE_USER_KEY = f'{HASH_TAG}:share_user_ids'
+# list of IDs used by previous version, moved by migrate_legacy_ids
+_LEGACY_KEY = f'{REDIS_PREFIX}:share_user'
 
+_MIN_ID = 100000000
+_MAX_ID = 999999999
 
-def generate():
-    _id = random.randint(100000000, 999999999)
+# workers forked from one process share the state of module random
+_random = random.SystemRandom()
 
-    values = client.lrange(_KEY, 0, -1)
-    while _id in [int(x) for x in values]:
-        _id = generate()
 
-    client.lpush(_KEY, _id)
-    return _id
+def generate() -> int:
+    return reserve(1)[0]
 
 
-def remove(share_user_id: int):
-    client.lrem(_KEY, 0, share_user_id)
+def reserve(count: int) -> List[int]:
+    """
+    Allocate count IDs in batch, one round trip for each batch of candidates
+    """
+    ids = []
+    while len(ids) < count:
+        candidates = list({_random.randint(_MIN_ID, _MAX_ID) for _ in range(count - len(ids))})
+        pipe = client.pipeline()
+        for x in candidates:
+            pipe.sadd(SHARE_USER_KEY, x)
+        ids.extend(x for x, added in zip(candidates, pipe.execute()) if added)
+    return ids
+
+
+def remove(*share_user_ids: int):
+    ids = [x for x in share_user_ids if x is not None]
+    if ids:
+        client.srem(SHARE_USER_KEY, *ids)
+
+
+def migrate_legacy_ids() -> int:
+    """
+    Keep the IDs allocated by previous version, meetings may be still using them, return number of them
+    """
+    ids = client.lrange(_LEGACY_KEY, 0, -1)
+    if ids:
+        client.sadd(SHARE_USER_KEY, *ids)
+        client.delete(_LEGACY_KEY)
+    return len(ids)
@@ -145,6 +145,16 @@ ERROR = {
         'data': '',
         'message': 'poll already done'
     },
+    'POLL_BUSY': {
+        'code': 50010,
+        'data': '',
+        'message': 'too many ballots, try again later'
+    },
+    'POLL_ALREADY_VOTED': {
+        'code': 50011,
+        'data': '',
+        'message': 'already voted in this round'
+    },
 
     # Group
     'GROUP_ALREADY_START': {
@@ -1,9 +1,86 @@
 import json
+import logging
+import threading
+import time
 from urllib.parse import urljoin
 
 import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from meeting_sample.settings import APP_KEY, LVB_HOST
+from meeting_sample.settings import APP_KEY, LVB_HOST, LVB_CONNECT_TIMEOUT, LVB_READ_TIMEOUT, LVB_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fail fast after failure_threshold continuous failures, and let one call try again after reset_timeout seconds
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.time() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError(f'LVB is unavailable after {self._failures} failures')
+            # half open: let this call try, others fail fast until it finishes
+            self._opened_at = time.time()
+
+    def on_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def on_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.error(f'open circuit of LVB after {self._failures} failures')
+                self._opened_at = time.time()
+
+
+def _new_session() -> requests.Session:
+    # connection errors are retried for all methods, read errors and 5xx only for GET
+    retry = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset(['GET']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LVB_POOL_SIZE, max_retries=retry)
+    s = requests.Session()
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    return s
+
+
+session = _new_session()
+breaker = CircuitBreaker()
+timeout = (LVB_CONNECT_TIMEOUT, LVB_READ_TIMEOUT)
+
+
+def _request(method: str, url: str, **kwargs) -> requests.Response:
+    breaker.before_call()
+    try:
+        resp = session.request(method, url, timeout=timeout, **kwargs)
+    except requests.RequestException:
+        breaker.on_failure()
+        raise
+    if resp.status_code >= 500:
+        breaker.on_failure()
+    else:
+        breaker.on_success()
+    return resp
 
 
 def stop_lvb_room(token: str) -> (bool, int):
@@ -14,7 +91,7 @@ def stop_lvb_room(token: str) -> (bool, int):
         'app-key': APP_KEY,
         'token': token,
     }
-    resp = requests.get(meeting_id_url, headers=header)
+    resp = _request('GET', meeting_id_url, headers=header)
     if resp.status_code != 200:
         raise RuntimeError(resp.content)
 
@@ -23,8 +100,12 @@ def stop_lvb_room(token: str) -> (bool, int):
     if lvb_room_id == 0:
         return True, 0
 
-    resp = requests.post(stop_url, headers=header, data=resp.content)
+    resp = _request('POST', stop_url, headers=header, data=resp.content)
     if resp.status_code != 200:
         raise RuntimeError(resp.content)
 
     return json.loads(resp.content)['success'], lvb_room_id
+
+
+# for ASGI, the call runs in a thread pool instead of blocking the event loop
+stop_lvb_room_async = sync_to_async(stop_lvb_room, thread_sensitive=False)
@@ -0,0 +1,62 @@
+"""
+Local stub of LVB API for latency and failure tests, set LVB_HOST to its address, etc:
+
+    python -m utils.lvb_stub --port 8090 --latency 0.05 --error-rate 0.1
+    LVB_HOST=http://127.0.0.1:8090 python manage.py runserver
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_room_ids = itertools.count(1)
+
+
+class LVBStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, as the real server
+    latency = 0.0
+    error_rate = 0.0
+
+    def _reply(self, status: int, body: dict):
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            status, body = 503, {'error': 'stub unavailable'}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith('/api/client/get_internal_room'):
+            self._reply(200, {'room_id': next(_room_ids)})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.startswith('/api/client/stop_room'):
+            self._reply(200, {'success': True})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='stub of LVB API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to delay each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='ratio of 503 responses')
+    args = parser.parse_args()
+
+    LVBStubHandler.latency = args.latency
+    LVBStubHandler.error_rate = args.error_rate
+    server = ThreadingHTTPServer((args.host, args.port), LVBStubHandler)
+    print(f'LVB stub listening on http://{args.host}:{args.port}')
+    server.serve_forever()